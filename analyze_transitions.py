@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Summarize transition logs into a transition matrix and funnel statistics.
+
+The logs are streamed one record at a time, so memory use depends only on
+the number of distinct states and conversations, not on the size of the logs.
+
+Usage:
+    python3 analyze_transitions.py LOG_DIR_OR_FILE [...]
+"""
+
+import sys
+from collections import Counter, defaultdict
+from glob import glob
+from os import path
+
+from transitions import read_records
+
+
+def find_logs(paths):
+    """List the log files in the given files and directories, oldest first.
+
+    Arguments:
+        paths (List[str]): Log files and directories of log files.
+
+    Returns:
+        List[str]: The log files.
+    """
+    filenames = []
+    for name in paths:
+        if path.isdir(name):
+            filenames.extend(sorted(glob(path.join(name, 'transitions-*.bin'))))
+        else:
+            filenames.append(name)
+    return filenames
+
+
+class TransitionStats:
+    """Running statistics over a stream of transitions."""
+
+    def __init__(self):
+        self.transitions = Counter()
+        self.latency = Counter()
+        self.visits = Counter()
+        self.outcomes = defaultdict(Counter)
+        self.last_state = {}
+        self.visited = defaultdict(set)
+        self.records = 0
+
+    def add(self, conversation, latency, from_state, to_state):
+        """Count one transition.
+
+        Arguments:
+            conversation (int): The conversation hash.
+            latency (float): Seconds spent responding.
+            from_state (str): The state before the transition.
+            to_state (str): The state entered, or `finish_<manner>`.
+        """
+        self.records += 1
+        self.transitions[from_state, to_state] += 1
+        self.latency[from_state] += latency
+        self.visits[from_state] += 1
+        states = self.visited[conversation]
+        states.add(from_state)
+        if to_state.startswith('finish_'):
+            # Credit the ending to every state this conversation went through
+            for state in states:
+                self.outcomes[state][to_state] += 1
+            del self.visited[conversation]
+            self.last_state.pop(conversation, None)
+        else:
+            states.add(to_state)
+            self.last_state[conversation] = to_state
+
+    def report(self, out=sys.stdout):
+        """Print the transition matrix and funnel statistics.
+
+        Arguments:
+            out (TextIO): Where to print the report.
+        """
+        sources = sorted({source for source, _ in self.transitions})
+        print(f'{self.records} transitions', file=out)
+        print(file=out)
+        print('Transitions (from -> to: count, share of from):', file=out)
+        for source in sources:
+            targets = [
+                (count, target) for (s, target), count in self.transitions.items()
+                if s == source
+            ]
+            total = sum(count for count, _ in targets)
+            mean = self.latency[source] / self.visits[source]
+            print(f'  {source} ({total}, {mean * 1e6:.0f} us mean latency)', file=out)
+            for count, target in sorted(targets, reverse=True):
+                print(f'    -> {target}: {count} ({count / total:.0%})', file=out)
+
+        print(file=out)
+        endings = Counter()
+        for (_, target), count in self.transitions.items():
+            if target.startswith('finish_'):
+                endings[target] += count
+        abandoned = Counter(self.last_state.values())
+        print('Conversation endings:', file=out)
+        for target, count in endings.most_common():
+            print(f'  {target}: {count}', file=out)
+        for state, count in abandoned.most_common():
+            print(f'  (no reply after {state}): {count}', file=out)
+
+        print(file=out)
+        print('Funnel (conversations through a state, by ending):', file=out)
+        for state in sorted(self.outcomes):
+            outcomes = self.outcomes[state]
+            total = sum(outcomes.values())
+            shares = ', '.join(
+                f'{target} {count / total:.0%}'
+                for target, count in outcomes.most_common()
+            )
+            print(f'  {state} ({total}): {shares}', file=out)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1].strip(), file=sys.stderr)
+        sys.exit(2)
+    stats = TransitionStats()
+    for filename in find_logs(sys.argv[1:]):
+        for conversation, _, latency, from_state, to_state, _ in read_records(filename):
+            stats.add(conversation, latency, from_state, to_state)
+    stats.report()
+
+
+if __name__ == '__main__':
+    main()
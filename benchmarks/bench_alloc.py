@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Measure the allocations and time each incoming message costs before routing.
+
+Every message of the benchmark transcripts is sent through the path from a
+Slack event to its tags twice: the way it was before messages were
+normalized once (the @-mention split off a copy of the text, the lexicon
+lowercased and sliced it, and the fallback classifier lowercased and split
+it again), and through `normalize.Message`. The normalized path is measured
+with the lexicon caches cleared before every message and with them warmed
+up.
+
+For each message, tracemalloc counts the memory blocks allocated for what
+the rest of the turn keeps (the message and its tags), from a snapshot
+taken after it is handled, and the peak memory traced while handling it,
+which is where short-lived allocations show up. The time per message is
+measured without tracing, in rounds that alternate between the paths so
+that they see the same load; the fastest round of each is reported.
+
+Usage:
+    python3 benchmarks/bench_alloc.py [repeats] [rounds]
+"""
+
+import re
+import sys
+import tracemalloc
+from collections import Counter
+from os import path
+from time import perf_counter
+from zlib import crc32
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import slackbot  # noqa: E402
+from fallback import features  # noqa: E402
+from normalize import normalize  # noqa: E402
+from oxycsbot import OxyCSBot  # noqa: E402
+
+BOT_ID = 'UBOT'
+BUCKETS = 2048
+TRANSCRIPTS = ['routing_eval.tsv', 'fallback_eval.tsv', 'fragments.tsv']
+
+LEGACY_TOKEN = re.compile(r"\w+|[^\w\s]")
+LEGACY_WORD = re.compile(r"[a-z']+")
+
+
+def legacy_get_at_message(event, bot_id):
+    """Extract an @-message the way slackbot did before."""
+    if event['type'] != 'message' or 'subtype' in event:
+        return None
+    if ' ' not in event['text']:
+        return None
+    user_id, message = event['text'].split(' ', maxsplit=1)
+    if user_id != ('<@' + bot_id + '>'):
+        return None
+    return message.strip()
+
+
+def legacy_match(lexicon, message):
+    """Tag a message the way Lexicon.match did before."""
+    counter = Counter()
+    tokens = LEGACY_TOKEN.findall(message.lower())
+    seen = set()
+    for i, token in enumerate(tokens):
+        entries = lexicon.index.get(token)
+        if entries is None:
+            continue
+        for phrase, rest, tags, weight in entries:
+            if phrase in seen:
+                continue
+            if rest and tokens[i + 1:i + 1 + len(rest)] != list(rest):
+                continue
+            seen.add(phrase)
+            for tag in tags:
+                counter[tag] += weight
+    return counter
+
+
+def legacy_features(message, buckets):
+    """Hash the fallback features of a message the way fallback did before."""
+    words = LEGACY_WORD.findall(message.lower())
+    names = ['w:' + word for word in words]
+    names.extend(f'b:{first} {second}' for first, second in zip(words, words[1:]))
+    for word in words:
+        padded = f'<{word}>'
+        names.extend('c:' + padded[i:i + 3] for i in range(len(padded) - 2))
+    mask = buckets - 1
+    return [crc32(name.encode('utf-8')) & mask for name in names]
+
+
+def legacy_pipeline(lexicon, event):
+    message = legacy_get_at_message(event, BOT_ID)
+    tags = legacy_match(lexicon.default, message)
+    if not tags:
+        legacy_features(message, BUCKETS)
+    return message, tags
+
+
+def pipeline(lexicon, event):
+    message = normalize(slackbot.get_at_message(event, BOT_ID))
+    tags = lexicon.match(message)
+    if not tags:
+        features(message, BUCKETS)
+    return message, tags
+
+
+def uncached_pipeline(lexicon, event):
+    lexicon.default.cache.clear()
+    for compiled in lexicon.lexicons.values():
+        compiled.cache.clear()
+    return pipeline(lexicon, event)
+
+
+def load_events():
+    """Wrap every transcript message in a Slack @-message event.
+
+    Returns:
+        List[Dict[str, str]]: The events.
+    """
+    here = path.dirname(path.abspath(__file__))
+    events = []
+    for name in TRANSCRIPTS:
+        with open(path.join(here, name)) as transcript:
+            for line in transcript:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                columns = line.rstrip('\n').split('\t')
+                text = columns[-1] if name == 'fragments.tsv' else columns[-2]
+                events.append({
+                    'type': 'message',
+                    'channel': 'C1',
+                    'user': 'U1',
+                    'text': f'<@{BOT_ID}> {text}',
+                })
+    return events
+
+
+def trace(handle, lexicon, events):
+    """Trace the memory allocated while handling each event.
+
+    Returns:
+        float: The mean number of blocks allocated per message for what the
+            turn keeps.
+        float: The mean peak memory per message, in bytes.
+        int: The largest peak memory of any message, in bytes.
+    """
+    blocks = []
+    peaks = []
+    tracemalloc.start()
+    for event in events:
+        tracemalloc.clear_traces()
+        kept = handle(lexicon, event)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        snapshot = tracemalloc.take_snapshot()
+        blocks.append(sum(stat.count for stat in snapshot.statistics('filename')))
+        del kept, snapshot
+    tracemalloc.stop()
+    return sum(blocks) / len(blocks), sum(peaks) / len(peaks), max(peaks)
+
+
+def time_rounds(handlers, lexicon, events, repeats, rounds):
+    """Time each way of handling the events, taking turns between them.
+
+    Returns:
+        List[float]: The mean time per message of each handler in its
+            fastest round, in seconds.
+    """
+    best = [float('inf')] * len(handlers)
+    for _ in range(rounds):
+        for i, handle in enumerate(handlers):
+            start = perf_counter()
+            for _ in range(repeats):
+                for event in events:
+                    handle(lexicon, event)
+            best[i] = min(best[i], (perf_counter() - start) / repeats / len(events))
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    events = load_events()
+    lexicon = OxyCSBot._lexicon
+
+    labels = ['before', 'normalized', 'normalized+cache']
+    handlers = [legacy_pipeline, uncached_pipeline, pipeline]
+    traced = [trace(legacy_pipeline, lexicon, events), trace(uncached_pipeline, lexicon, events)]
+    for event in events:
+        pipeline(lexicon, event)
+    traced.append(trace(pipeline, lexicon, events))
+    times = time_rounds(handlers, lexicon, events, repeats, rounds)
+
+    print(f'{len(events)} messages, {rounds} rounds of {repeats} repeats')
+    print(f'{"":>16}  {"blocks kept":>11}  {"mean peak B":>11}  {"max peak B":>10}  {"us/message":>10}')
+    for label, (blocks, mean_peak, max_peak), seconds in zip(labels, traced, times):
+        print(f'{label:>16}  {blocks:11.1f}  {mean_peak:11.0f}  {max_peak:10d}  {seconds * 1e6:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
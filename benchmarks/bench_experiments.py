@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Measure the latency added to each turn by OxyCSBot's EXPERIMENTS.
+
+Times the pieces an experiment adds to a turn: assigning a conversation its
+variant (the first time, and after that), serving a variant instead of
+calling the method, and counting a finish against the variants seen. Then
+replays conversations that go through every experiment against OxyCSBot and
+against a copy of it with the original methods, and reports the difference
+per turn, which should be well under a microsecond.
+
+Usage:
+    python3 benchmarks/bench_experiments.py [conversations] [repeats]
+"""
+
+import sys
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from oxycsbot import OxyCSBot  # noqa: E402
+
+ControlOxyCSBot = type('ControlOxyCSBot', (OxyCSBot,), {
+    experiment.method: experiment.original for experiment in OxyCSBot.EXPERIMENTS
+})
+
+SCRIPTS = [
+    ['hi', "i'm so anxious and stressed", 'yes', 'thanks'],
+    ['hi', 'i want to kill myself', 'no', 'thanks'],
+    ['hello', "i'm so anxious", 'no', 'no', 'no', 'no'],
+    ['hey', 'i feel so lonely', 'no', 'ok thanks'],
+]
+
+
+def best_time(function, repeats, runs=7):
+    """Time a function.
+
+    Returns:
+        float: The best of `runs` mean times per call, in seconds.
+    """
+    best = float('inf')
+    for _ in range(runs):
+        start = perf_counter()
+        for _ in range(repeats):
+            function()
+        best = min(best, (perf_counter() - start) / repeats)
+    return best
+
+
+def replay(bot_class, conversations):
+    """Replay the scripts once for each conversation.
+
+    Returns:
+        int: The number of turns.
+    """
+    turns = 0
+    for i in range(conversations):
+        script = SCRIPTS[i % len(SCRIPTS)]
+        bot = bot_class(conversation=('C0001', f'U{i:08X}'))
+        for message in script:
+            bot.respond(message)
+        turns += len(script)
+    return turns
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    experiment = OxyCSBot.EXPERIMENTS[0]
+    bot = OxyCSBot(conversation=('C0001', 'U00000001'))
+
+    def first_exposure():
+        bot.exposures = None
+        experiment.assign(bot)
+
+    served = getattr(OxyCSBot, experiment.method)
+    assign = best_time(first_exposure, repeats)
+    assign_again = best_time(lambda: experiment.assign(bot), repeats)
+    serve = best_time(lambda: served(bot), repeats)
+    original = best_time(lambda: experiment.original(bot), repeats)
+
+    def finish(exposures):
+        def run():
+            bot.exposures = exposures
+            bot.finish('thanks')
+        return run
+
+    exposed = {tried: 0 for tried in OxyCSBot.EXPERIMENTS}
+    credit = best_time(finish(exposed), repeats) - best_time(finish(None), repeats)
+    for tried in OxyCSBot.EXPERIMENTS:
+        for i in range(len(tried.counts)):
+            tried.counts[i] = 0
+    print('per call:')
+    print(f'  assign (first in conversation): {assign * 1e9:8.0f} ns')
+    print(f'  assign (memoized):              {assign_again * 1e9:8.0f} ns')
+    print(f'  serve variant:                  {serve * 1e9:8.0f} ns'
+          f' ({original * 1e9:.0f} ns for {experiment.method} itself)')
+    print(f'  count {len(exposed)} exposures at finish:    {credit * 1e9:8.0f} ns')
+
+    times = {ControlOxyCSBot: float('inf'), OxyCSBot: float('inf')}
+    for _ in range(15):
+        for bot_class in times:
+            start = perf_counter()
+            turns = replay(bot_class, conversations)
+            times[bot_class] = min(times[bot_class], (perf_counter() - start) / turns)
+    added = times[OxyCSBot] - times[ControlOxyCSBot]
+    print(f'replay of {turns} turns in {conversations} conversations:')
+    print(f'  without experiments: {times[ControlOxyCSBot] * 1e6:8.2f} us per turn')
+    print(f'  with experiments:    {times[OxyCSBot] * 1e6:8.2f} us per turn')
+    print(f'  added:               {added * 1e6:8.2f} us per turn')
+    for tried in OxyCSBot.EXPERIMENTS:
+        print(tried.report())
+
+
+if __name__ == '__main__':
+    main()
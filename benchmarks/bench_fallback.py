@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Measure the precision, recall and latency of the fallback classifier.
+
+Each line of the evaluation set is `message<TAB>expected tag`, where the
+message matches no TAGS and an empty expected tag means the classifier should
+not guess. None of it is used to train the model or tune its threshold.
+Precision is the share of the classifier's guesses that are right, counting a
+guess on a message that should get no tag as wrong; recall is the share of
+tagged messages given their tag; and false routing is the share of messages
+with no tag that are given one anyway.
+
+Usage:
+    python3 benchmarks/bench_fallback.py [fallback_model.json] [fallback_eval.tsv] [repeats]
+"""
+
+import sys
+from os import path
+from time import perf_counter
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fallback import FallbackClassifier  # noqa: E402
+from oxycsbot import OxyCSBot  # noqa: E402
+
+
+def main():
+    model = sys.argv[1] if len(sys.argv) > 1 else path.join(ROOT, 'fallback_model.json')
+    default = path.join(ROOT, 'benchmarks', 'fallback_eval.tsv')
+    filename = sys.argv[2] if len(sys.argv) > 2 else default
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    cases = []
+    with open(filename) as cases_file:
+        for line in cases_file:
+            if line.strip() and not line.startswith('#'):
+                message, expected = line.rstrip('\n').split('\t')
+                cases.append((message, expected))
+
+    bot = OxyCSBot()
+    for message, _ in cases:
+        if bot._get_tags(message):
+            print(f'warning: {message!r} matches TAGS', file=sys.stderr)
+
+    classifier = FallbackClassifier(model)
+    start = perf_counter()
+    classifier.load()
+    load_time = perf_counter() - start
+
+    correct = guesses = right = tagged = negatives = routed = 0
+    for message, expected in cases:
+        tags = classifier.classify(message)
+        actual = next(iter(tags), '')
+        correct += actual == expected
+        guesses += bool(actual)
+        right += bool(actual) and actual == expected
+        tagged += bool(expected)
+        negatives += not expected
+        routed += bool(actual) and not expected
+        if actual != expected:
+            print(f'  {message!r} -> {actual or "-"} (expected {expected or "-"})')
+    print(f'threshold: {classifier.threshold:.2f}')
+    print(f'accuracy: {correct}/{len(cases)} ({correct / len(cases):.0%})')
+    print(f'precision: {right}/{guesses} guesses right ({right / guesses if guesses else 1:.0%})')
+    print(f'recall: {right}/{tagged} tagged messages found ({right / tagged if tagged else 0:.0%})')
+    print(f'false routing: {routed}/{negatives} messages with no tag given one'
+          f' ({routed / negatives if negatives else 0:.0%})')
+    print(f'model load: {load_time * 1000:.1f} ms (on first use)')
+
+    for _ in range(repeats):
+        for message, _ in cases:
+            classifier.classify(message)
+    print(classifier.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Load test the HTTP service under gunicorn with different worker counts.
+
+For each worker count, starts `gunicorn service:app` on a local port with
+`gunicorn.conf.py`, and has client processes hold scripted conversations with
+it for a while, each sending back the session it was given, one message per
+request to `/respond` and then whole conversations per request to
+`/respond/batch`. Reports the requests and messages answered per second, the
+latency percentiles of the requests, and the memory of each worker that is
+shared with the other workers and private to it.
+
+Clients run on the same machine as the workers, so on a machine with few
+cores they compete with them; use fewer clients than cores for the cleanest
+numbers.
+
+Usage:
+    python3 benchmarks/bench_http.py [--workers 1 2 4] [--clients 4] [--duration 5]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+from multiprocessing import Pool
+from os import path
+from time import perf_counter, sleep
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+SCRIPTS = [
+    ['hi', "i'm so anxious and stressed", 'yes', 'thanks'],
+    ['hi', 'i want to kill myself', 'no', 'thanks'],
+    ['hello', "i'm so anxious", 'no', 'no', 'no', 'no'],
+    ['hey', 'i feel so lonely', 'no', 'ok thanks'],
+    ['hola', 'estoy muy triste y solo', 'no', 'gracias'],
+]
+
+
+def post(connection, url, body):
+    """Post a JSON request.
+
+    Returns:
+        Dict[str, Any]: The JSON response.
+    """
+    connection.request('POST', url, json.dumps(body), {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    data = response.read()
+    if response.status != 200:
+        raise RuntimeError(f'{url} answered {response.status}: {data!r}')
+    return json.loads(data)
+
+
+def client(args):
+    """Hold conversations with the service until the deadline.
+
+    Arguments:
+        args (Tuple[int, int, float, bool]): The port, the number of this
+            client, how many seconds to run for, and whether to send whole
+            conversations as batches.
+
+    Returns:
+        List[float]: The latency of each request, in seconds.
+        int: The number of messages answered.
+    """
+    port, number, duration, batch = args
+    latencies = []
+    messages = 0
+    deadline = perf_counter() + duration
+    count = 0
+    while perf_counter() < deadline:
+        script = SCRIPTS[(number + count) % len(SCRIPTS)]
+        conversation = f'client{number}-{count}'
+        count += 1
+        # The sync worker closes the connection after every request
+        if batch:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            start = perf_counter()
+            post(connection, '/respond/batch', {'messages': [
+                {'conversation': conversation, 'text': text} for text in script
+            ]})
+            latencies.append(perf_counter() - start)
+            connection.close()
+            messages += len(script)
+            continue
+        session = None
+        for text in script:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            message = {'conversation': conversation, 'text': text}
+            if session is not None:
+                message['session'] = session
+            start = perf_counter()
+            session = post(connection, '/respond', message)['session']
+            latencies.append(perf_counter() - start)
+            connection.close()
+            messages += 1
+    return latencies, messages
+
+
+def worker_memory(master):
+    """Measure the memory of the workers of a gunicorn master.
+
+    Returns:
+        List[Tuple[int, int]]: The shared and private kilobytes of each worker.
+    """
+    with open(f'/proc/{master}/task/{master}/children') as children:
+        pids = children.read().split()
+    memory = []
+    for pid in pids:
+        fields = {}
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            for line in smaps:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+        shared = fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)
+        private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+        memory.append((shared, private))
+    return memory
+
+
+def start_server(workers, port):
+    """Start gunicorn and wait until it answers.
+
+    Returns:
+        subprocess.Popen: The gunicorn master.
+    """
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '-w', str(workers), '-b', f'127.0.0.1:{port}', 'service:app'],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', '/health')
+            connection.getresponse().read()
+            connection.close()
+            # Give the other workers time to boot as well
+            sleep(0.5)
+            return server
+        except OSError:
+            sleep(0.1)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def percentile(sorted_values, share):
+    """Find a percentile of some sorted values."""
+    return sorted_values[min(len(sorted_values) - 1, int(share * len(sorted_values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts to test')
+    parser.add_argument('--clients', type=int, default=4, help='client processes')
+    parser.add_argument('--duration', type=float, default=5, help='seconds to run each test for')
+    parser.add_argument('--port', type=int, default=8765, help='port to serve on')
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} CPUs, {args.clients} clients, {args.duration:g} s per test')
+    print(f'{"workers":>7} {"endpoint":>14} {"req/s":>8} {"msg/s":>8}'
+          f' {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"shared MiB":>11} {"private MiB":>12}')
+    with Pool(args.clients) as pool:
+        for workers in args.workers:
+            server = start_server(workers, args.port)
+            try:
+                for batch in (False, True):
+                    start = perf_counter()
+                    results = pool.map(client, [
+                        (args.port, number, args.duration, batch) for number in range(args.clients)
+                    ])
+                    elapsed = perf_counter() - start
+                    latencies = sorted(latency for result, _ in results for latency in result)
+                    messages = sum(count for _, count in results)
+                    memory = worker_memory(server.pid)
+                    shared = sum(kb for kb, _ in memory) / len(memory) / 1024
+                    private = sum(kb for _, kb in memory) / len(memory) / 1024
+                    print(' '.join([
+                        f'{workers:7d}',
+                        f'{"/respond/batch" if batch else "/respond":>14}',
+                        f'{len(latencies) / elapsed:8.0f}',
+                        f'{messages / elapsed:8.0f}',
+                        f'{percentile(latencies, 0.5) * 1000:8.2f}',
+                        f'{percentile(latencies, 0.9) * 1000:8.2f}',
+                        f'{percentile(latencies, 0.99) * 1000:8.2f}',
+                        f'{shared:11.1f}',
+                        f'{private:12.1f}',
+                    ]))
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
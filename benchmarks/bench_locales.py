@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Measure locale detection and the cost of supporting more locales.
+
+Reads `locale_eval.tsv` (one `locale<TAB>message` line per message, where
+mixed messages list their locales as eg. `en+es`) and reports how often
+`locales.detect_all` finds the right locales, and checks that the messages of
+`locale_tags.tsv` (`message<TAB>tags`) get exactly their tags. Then tags
+every message with lexicons that support no other locales, Spanish, and
+Spanish and Chinese, and reports the time per message in each locale, and the memory each
+locale's lexicon takes once it has been loaded.
+
+Usage:
+    python3 benchmarks/bench_locales.py [repeats]
+"""
+
+import sys
+import tracemalloc
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from lexicon import LocalizedLexicon  # noqa: E402
+from locales import detect_all  # noqa: E402
+from normalize import normalize  # noqa: E402
+from oxycsbot import OxyCSBot  # noqa: E402
+
+
+def load_messages(filename):
+    """Load the labelled messages.
+
+    Returns:
+        List[Tuple[str, str]]: The two columns of each line; the locale and
+            text of each message in `locale_eval.tsv`.
+    """
+    messages = []
+    with open(filename, encoding='utf-8') as messages_file:
+        for line in messages_file:
+            if not line.strip() or line.startswith('#'):
+                continue
+            locale, text = line.rstrip('\n').split('\t', maxsplit=1)
+            messages.append((locale, text))
+    return messages
+
+
+def time_per_message(lexicon, texts, repeats):
+    """Time tagging messages, normalizing each one as it arrives.
+
+    The lexicon caches are cleared before every message, so every message is
+    detected and matched in full.
+
+    Returns:
+        float: The best of five mean times per message, in seconds.
+    """
+    lexicons = [lexicon.default] + list(lexicon.lexicons.values())
+    best = float('inf')
+    for _ in range(5):
+        start = perf_counter()
+        for _ in range(repeats):
+            for text in texts:
+                for cached in lexicons:
+                    cached.cache.clear()
+                lexicon.match(normalize(text))
+        best = min(best, (perf_counter() - start) / repeats / len(texts))
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    here = path.dirname(path.abspath(__file__))
+    messages = load_messages(path.join(here, 'locale_eval.tsv'))
+
+    correct = 0
+    for locale, text in messages:
+        detected = '+'.join(found or 'en' for found in detect_all(normalize(text)))
+        if detected == locale:
+            correct += 1
+        else:
+            print(f'  {text!r} -> {detected} (expected {locale})')
+    print(f'detection: {correct}/{len(messages)} correct ({correct / len(messages):.0%})')
+
+    lexicon = LocalizedLexicon(OxyCSBot.TAGS, OxyCSBot.PHRASE_WEIGHTS, OxyCSBot.LOCALES)
+    correct = 0
+    cases = load_messages(path.join(here, 'locale_tags.tsv'))
+    for text, expected in cases:
+        tags = ','.join(sorted(lexicon.match(text)))
+        if tags == expected:
+            correct += 1
+        else:
+            print(f'  {text!r} -> {tags or "-"} (expected {expected or "-"})')
+    print(f'tags: {correct}/{len(cases)} correct ({correct / len(cases):.0%})')
+
+    by_locale = {}
+    for locale, text in messages:
+        by_locale.setdefault(locale, []).append(text)
+    print(f'{"supported":>12}  ' + '  '.join(f'{locale + " us":>8}' for locale in by_locale))
+    for supported in ([], ['es'], ['es', 'zh']):
+        locales = {locale: OxyCSBot.LOCALES[locale] for locale in supported}
+        lexicon = LocalizedLexicon(OxyCSBot.TAGS, OxyCSBot.PHRASE_WEIGHTS, locales)
+        for locale in supported:
+            lexicon.lexicon(locale)
+        times = [time_per_message(lexicon, texts, repeats) for texts in by_locale.values()]
+        print(f'{"+".join(["en"] + supported):>12}  '
+              + '  '.join(f'{seconds * 1e6:8.2f}' for seconds in times))
+
+    lexicon = LocalizedLexicon(OxyCSBot.TAGS, OxyCSBot.PHRASE_WEIGHTS, OxyCSBot.LOCALES)
+    for locale in OxyCSBot.LOCALES:
+        tracemalloc.start()
+        lexicon.lexicon(locale)
+        loaded = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'{locale} lexicon: {loaded / 1024:.1f} KiB once loaded, 0 before')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Measure saving and resuming conversations across worker generations.
+
+Makes chatbots for a number of conversations in random states, then times
+how long the old worker takes to save them with `snapshot.write_snapshot`
+and how long the new worker takes to load the snapshot, resume a
+conversation, and save the conversations it never resumed. Every resumed
+chatbot is checked against the one that was saved, and the snapshot is also
+loaded by a version of the chatbot with a renamed state.
+
+Usage:
+    python3 benchmarks/bench_snapshot.py [conversations]
+"""
+
+import os
+import random
+import sys
+import tempfile
+from os import path
+from time import perf_counter, time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from oxycsbot import OxyCSBot  # noqa: E402
+from snapshot import Snapshot, conversation_record, write_snapshot  # noqa: E402
+
+FIELDS = ('state', 'prev_state', 'finish_flag', 'greeted_flag', 'try_count', 'last_active')
+
+
+def make_bots(count, rng):
+    """Make chatbots in random states.
+
+    Returns:
+        Dict[Tuple[str, str], OxyCSBot]: The chatbot of each conversation.
+    """
+    now = time()
+    bots = {}
+    for i in range(count):
+        key = (f'C{rng.randrange(1000):04d}', f'U{i:08X}')
+        bot = bots[key] = OxyCSBot(conversation=key)
+        bot.state = rng.choice(OxyCSBot.STATES)
+        bot.prev_state = rng.choice(OxyCSBot.STATES)
+        bot.finish_flag = rng.random() < 0.2
+        bot.greeted_flag = rng.random() < 0.5
+        bot.try_count = rng.randrange(3)
+        bot.last_active = now - rng.uniform(0, 3600)
+    return bots
+
+
+def renamed(name):
+    """Rename the 'clubs' state to 'join_clubs'."""
+    return 'join_clubs' if name == 'clubs' else name
+
+
+class RenamedOxyCSBot(OxyCSBot):
+    """A newer OxyCSBot, whose 'clubs' state is now called 'join_clubs'."""
+
+    STATES = [renamed(state) for state in OxyCSBot.STATES]
+    RENAMED_STATES = {'clubs': 'join_clubs'}
+    ROUTES = {
+        renamed(state): [rule[:1] + (renamed(rule[1]),) + rule[2:] for rule in rules]
+        for state, rules in OxyCSBot.ROUTES.items()
+    }
+    on_enter_join_clubs = OxyCSBot.on_enter_clubs
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    bots = make_bots(count, random.Random(0))
+    directory = tempfile.mkdtemp()
+    filename = path.join(directory, 'conversations.snapshot')
+
+    start = perf_counter()
+    write_snapshot(filename, map(conversation_record, bots.values()))
+    save = perf_counter() - start
+    size = path.getsize(filename)
+
+    start = perf_counter()
+    saved = Snapshot.load(filename, OxyCSBot)
+    load = perf_counter() - start
+
+    keys = list(bots)
+    start = perf_counter()
+    for key in keys[:count // 2]:
+        bot = saved.take(key)
+        assert all(getattr(bot, field) == getattr(bots[key], field) for field in FIELDS)
+        assert bot.state is bots[key].state
+    take = (perf_counter() - start) / (count // 2)
+
+    start = perf_counter()
+    write_snapshot(filename, saved.records())
+    resave = perf_counter() - start
+
+    renamed = Snapshot.load(filename, RenamedOxyCSBot)
+    moved = 0
+    for key in keys[count // 2:]:
+        bot = renamed.take(key)
+        assert bot.state == bots[key].state or bot.state == 'join_clubs'
+        moved += bot.state == 'join_clubs'
+    os.remove(filename)
+    os.rmdir(directory)
+
+    print(f'{count} conversations, {size / 2 ** 20:.1f} MiB snapshot ({size / count:.1f} bytes each)')
+    print(f'  save on SIGTERM: {save * 1000:8.1f} ms')
+    print(f'  load on start:   {load * 1000:8.1f} ms')
+    print(f'  resume one:      {take * 1e6:8.1f} us (on its next message)')
+    print(f'  save unresumed:  {resave * 1000:8.1f} ms ({len(saved)} conversations)')
+    print(f'  renamed state:   {moved} conversations resumed in join_clubs')
+
+
+if __name__ == '__main__':
+    main()
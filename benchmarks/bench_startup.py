@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Measure the cold start of the chatbot: time to import it and send a reply.
+
+Each run starts a fresh interpreter that imports the chatbot, creates it and
+answers one message, so it includes everything a restarted dyno pays before
+its first reply (except connecting to Slack). The slowest imports of the last
+run are listed from `python -X importtime`.
+
+Usage:
+    python3 benchmarks/bench_startup.py [runs] [module]
+"""
+
+import subprocess
+import sys
+from os import path
+from statistics import median
+from time import perf_counter
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+TARGET_MS = 60
+
+FIRST_REPLY = '''
+import time
+start = time.perf_counter()
+from {module} import OxyCSBot
+imported = time.perf_counter()
+OxyCSBot().respond("hi, i'm feeling overwhelmed")
+replied = time.perf_counter()
+print((imported - start) * 1000, (replied - imported) * 1000)
+'''
+
+
+def run_once(module, importtime=False):
+    """Time one cold start in a fresh interpreter.
+
+    Arguments:
+        module (str): The module to import OxyCSBot from.
+        importtime (bool): Whether to collect `-X importtime` output.
+
+    Returns:
+        float: Milliseconds from interpreter launch to the first reply.
+        float: Milliseconds to import the chatbot.
+        float: Milliseconds to create it and reply.
+        str: The `-X importtime` output, if collected.
+    """
+    command = [sys.executable, '-W', 'ignore']
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', FIRST_REPLY.format(module=module)]
+    start = perf_counter()
+    result = subprocess.run(
+        command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True,
+    )
+    total = (perf_counter() - start) * 1000
+    imported, replied = map(float, result.stdout.split())
+    return total, imported, replied, result.stderr
+
+
+def slowest_imports(importtime, count=8):
+    """List the imports with the largest cumulative time."""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((int(cumulative_us), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    module = sys.argv[2] if len(sys.argv) > 2 else 'oxycsbot'
+    run_once(module)  # make sure bytecode is cached
+    results = [run_once(module) for _ in range(runs)]
+    totals = [total for total, _, _, _ in results]
+    print(f'{runs} cold starts of {module}:')
+    print(f'  time to first reply: {median(totals):.1f} ms median, {max(totals):.1f} ms max (target {TARGET_MS} ms)')
+    print(f'  import:              {median(r[1] for r in results):.1f} ms median')
+    print(f'  create + reply:      {median(r[2] for r in results):.2f} ms median')
+    _, _, _, importtime = run_once(module, importtime=True)
+    print('  slowest imports (cumulative):')
+    for cumulative_us, name in slowest_imports(importtime):
+        print(f'    {cumulative_us / 1000:7.2f} ms  {name}')
+    if median(totals) > TARGET_MS:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
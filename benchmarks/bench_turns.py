@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Measure replies and CPU time saved by aggregating message fragments.
+
+Replays a transcript of fragmented messages (one `seconds<TAB>user<TAB>text`
+line per message) against OxyCSBot, once answering every message and once
+merging fragments with a TurnAggregator. The lexicon's tag cache is cleared
+before every replay, so repeats do not find the fragments already tagged.
+
+Usage:
+    python3 benchmarks/bench_turns.py [transcript.tsv] [window] [repeats]
+"""
+
+import sys
+from os import path
+from time import process_time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from oxycsbot import OxyCSBot  # noqa: E402
+from turns import TurnAggregator  # noqa: E402
+
+
+def load_transcript(filename):
+    """Load a fragment transcript.
+
+    Arguments:
+        filename (str): The transcript file.
+
+    Returns:
+        List[Tuple[float, str, str]]: The time, user and text of each message.
+    """
+    events = []
+    with open(filename) as transcript:
+        for line in transcript:
+            if not line.strip() or line.startswith('#'):
+                continue
+            seconds, user, text = line.rstrip('\n').split('\t', maxsplit=2)
+            events.append((float(seconds), user, text))
+    return events
+
+
+def replay(events, window):
+    """Replay a transcript, counting the replies the bot sends.
+
+    Arguments:
+        events (List[Tuple[float, str, str]]): The transcript.
+        window (float): The aggregation window; 0 answers every message.
+
+    Returns:
+        int: The number of replies.
+    """
+    lexicon = OxyCSBot._lexicon
+    for cached in [lexicon.default] + list(lexicon.lexicons.values()):
+        cached.cache.clear()
+    bots = {}
+    replies = 0
+
+    def reply(user, message, tags=None):
+        nonlocal replies
+        bot = bots.get(user)
+        if bot is None:
+            bot = bots[user] = OxyCSBot()
+        bot.respond(message, tags)
+        replies += 1
+
+    if window <= 0:
+        for _, user, text in events:
+            reply(user, text)
+        return replies
+
+    turns = TurnAggregator(OxyCSBot()._get_tags, window)
+    for now, user, text in events:
+        for key, message, tags in turns.pop_ready(now):
+            reply(key, message, tags)
+        turns.add(user, text, now)
+    for key, message, tags in turns.pop_ready(float('inf')):
+        reply(key, message, tags)
+    return replies
+
+
+def main():
+    default = path.join(path.dirname(path.abspath(__file__)), 'fragments.tsv')
+    filename = sys.argv[1] if len(sys.argv) > 1 else default
+    window = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    events = load_transcript(filename)
+
+    # Alternate the two modes and keep the best of each, so drift in the
+    # speed of the machine does not favour either
+    results = {}
+    for _ in range(5):
+        for label, w in (('per message', 0), (f'window {window}s', window)):
+            start = process_time()
+            for _ in range(repeats):
+                replies = replay(events, w)
+            cpu = (process_time() - start) / repeats
+            best = results.get(label, (replies, float('inf')))[1]
+            results[label] = (replies, min(cpu, best))
+
+    print(f'{len(events)} messages from {filename}')
+    for label, (replies, cpu) in results.items():
+        print(f'{label:>16}: {replies:4d} replies, {cpu * 1000:8.3f} ms CPU per replay')
+    (base_replies, base_cpu), (agg_replies, agg_cpu) = results.values()
+    print(' '.join([
+        f'reduction: {1 - agg_replies / base_replies:.0%} replies,',
+        f'{1 - agg_cpu / base_cpu:.0%} CPU',
+    ]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Compare OxyCSBot's weighted ROUTES against the old first-match chains.
+
+Each line of the evaluation set is `state<TAB>flags<TAB>message<TAB>target`,
+where flags is a comma separated list of chatbot flags (eg. `finish_flag`)
+that are set before routing, and target is the expected state or
+`finish_<manner>`.
+
+Usage:
+    python3 benchmarks/eval_routing.py [routing_eval.tsv] [repeats]
+"""
+
+import sys
+from os import path
+from timeit import default_timer
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from oxycsbot import OxyCSBot  # noqa: E402
+from legacy_routing import LegacyOxyCSBot  # noqa: E402
+
+
+def load_cases(filename):
+    """Load the evaluation set.
+
+    Arguments:
+        filename (str): The evaluation file.
+
+    Returns:
+        List[Tuple[str, List[str], str, str]]: The state, flags, message and
+            expected target of each case.
+    """
+    cases = []
+    with open(filename) as cases_file:
+        for line in cases_file:
+            if not line.strip() or line.startswith('#'):
+                continue
+            state, flags, message, expected = line.rstrip('\n').split('\t')
+            cases.append((state, [f for f in flags.split(',') if f], message, expected))
+    return cases
+
+
+def make_bot(bot_class, chosen):
+    """Create a chatbot that records where it would go instead of going."""
+    bot = bot_class()
+    bot.go_to_state = lambda state: chosen.append(state) or ''
+    bot.finish = lambda manner: chosen.append(f'finish_{manner}') or ''
+    return bot
+
+
+def evaluate(bot_class, cases, repeats):
+    """Route every case, returning the mistakes and the mean routing time.
+
+    Arguments:
+        bot_class (class): The chatbot class to evaluate.
+        cases (list): The evaluation set.
+        repeats (int): How many times to route each case for timing.
+
+    Returns:
+        List[Tuple[str, str, str, str]]: The state, message, expected and
+            actual target of each mistake.
+        float: The mean time to route one message, in seconds.
+    """
+    chosen = []
+    bot = make_bot(bot_class, chosen)
+    mistakes = []
+    elapsed = 0.0
+    for state, flags, message, expected in cases:
+        tags = bot._get_tags(message)
+        start = default_timer()
+        for _ in range(repeats):
+            bot.state = state
+            bot.finish_flag = 'finish_flag' in flags
+            bot.greeted_flag = 'greeted_flag' in flags
+            bot._respond_from(state, message, tags)
+        elapsed += default_timer() - start
+        actual = chosen[-1] if chosen else None
+        if actual != expected:
+            mistakes.append((state, message, expected, actual))
+        del chosen[:]
+    return mistakes, elapsed / (repeats * len(cases))
+
+
+def main():
+    default = path.join(path.dirname(path.abspath(__file__)), 'routing_eval.tsv')
+    filename = sys.argv[1] if len(sys.argv) > 1 else default
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    cases = load_cases(filename)
+
+    for label, bot_class in (('if/elif chains', LegacyOxyCSBot), ('weighted ROUTES', OxyCSBot)):
+        mistakes, latency = evaluate(bot_class, cases, repeats)
+        correct = len(cases) - len(mistakes)
+        print(' '.join([
+            f'{label:>16}: {correct}/{len(cases)} correct',
+            f'({correct / len(cases):.0%}),',
+            f'{latency * 1e6:.2f} us per routing decision',
+        ]))
+        for state, message, expected, actual in mistakes:
+            print(f'{"":18}{state}: {message!r} -> {actual} (expected {expected})')
+
+
+if __name__ == '__main__':
+    main()
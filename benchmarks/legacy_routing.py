@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""The first-match if/elif routing that OxyCSBot used before its ROUTES table.
+
+Kept as a frozen baseline for `eval_routing.py`; apart from the @goes_to
+declarations the state graph needs and renamed finish targets, do not update.
+"""
+
+import sys
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from oxycsbot import OxyCSBot  # noqa: E402
+from stategraph import goes_to  # noqa: E402
+
+
+class LegacyOxyCSBot(OxyCSBot):
+    """OxyCSBot routing on the first tag hit in a fixed order."""
+
+    ROUTES = {}
+
+    @goes_to(
+        'anxious_breathe',
+        'clubs',
+        'confused',
+        'finish_academic_resources',
+        'finish_cant_help',
+        'finish_course_overload_response',
+        'finish_good_response',
+        'finish_greeted_good_response',
+        'finish_health_resources',
+        'finish_success',
+        'finish_thanks',
+        'greeting',
+        'specific_event_response',
+        'suicidal_response_friends',
+        'talk_to_professors',
+        'why_sad',
+    )
+    def respond_from_waiting(self, message, tags):
+        if "sad" in tags:
+            return self.go_to_state('why_sad')
+        elif "good" in tags:
+            return self.finish("good_response")
+        elif "social isolation" in tags:
+            return self.go_to_state("clubs")
+        elif "suicidal" in tags:
+            return self.go_to_state('suicidal_response_friends')
+        elif "anxious" in tags:
+            return self.go_to_state('anxious_breathe')
+        elif "thanks" in tags and self.finish_flag:
+            return self.finish("thanks")
+        elif "thanks" in tags and not self.finish_flag:
+            return self.go_to_state("confused")
+        elif "idk" in tags:
+            return self.go_to_state("why_sad")
+        elif 'health issues' in tags:
+            return self.finish('health_resources')
+        elif "difficult courses" in tags:
+            return self.finish('academic_resources')
+        elif "courses overload" in tags:
+            return self.finish('course_overload_response')
+        elif "specific events" in tags:
+            return self.go_to_state("specific_event_response")
+        elif 'failing academics' in tags:
+            return self.go_to_state("talk_to_professors")
+        elif "help" in tags or "hi" in tags:
+            return self.go_to_state('greeting')
+        elif "success" in tags and self.finish_flag: # show success if user says ok at the end of conversation
+            return self.finish("success")
+        elif "success" in tags and self.greeted_flag:
+            self.greeted_flag = False
+            return self.finish("greeted_good_response")
+        elif "no" in tags and self.finish_flag:
+            return self.finish("cant_help")
+        else:
+            return self.go_to_state("confused")
+
+    @goes_to('finish_success', 'why_not')
+    def respond_from_anxious_breathe(self, message, tags):
+        if "yes" in tags:
+            return self.finish("success")
+        elif "no" in tags or "idk" in tags:
+            return self.go_to_state("why_not")
+
+
+    @goes_to(
+        'confused',
+        'finish_hotline',
+        'finish_hotline_idk',
+        'finish_talk_to_friends',
+    )
+    def respond_from_suicidal_response_friends(self, message, tags):
+        if "idk" in tags:
+            return self.finish('hotline_idk')
+        elif "no" in tags:
+            return self.finish('hotline')
+        elif "yes" in tags:
+            return self.finish('talk_to_friends')
+        else:
+            return self.go_to_state("confused")
+
+    @goes_to(
+        'anxious_breathe',
+        'clubs',
+        'confused',
+        'figure_out_feelings',
+        'finish_academic_resources',
+        'finish_cant_help',
+        'finish_course_overload_response',
+        'finish_good_response',
+        'finish_health_resources',
+        'finish_thanks',
+        'greeting',
+        'specific_event_response',
+        'suicidal_response_friends',
+        'talk_to_professors',
+        'why_sad',
+    )
+    def respond_from_why_sad(self, message, tags):
+        if "sad" in tags:
+            return self.go_to_state('why_sad')
+        elif "good" in tags:
+            return self.finish("good_response")
+        elif "suicidal" in tags:
+            return self.go_to_state('suicidal_response_friends')
+        elif "anxious" in tags:
+            return self.go_to_state('anxious_breathe')
+        elif "social isolation" in tags:
+            return self.go_to_state("clubs")
+        elif "thanks" in tags and self.finish_flag:
+            return self.finish("thanks")
+        elif "thanks" in tags and not self.finish_flag:
+            return self.go_to_state("confused")
+        elif 'failing academics' in tags:
+            return self.go_to_state("talk_to_professors")
+        elif "idk" in tags:
+            return self.go_to_state("figure_out_feelings")
+        elif 'health issues' in tags:
+            return self.finish('health_resources')
+        elif "difficult courses" in tags:
+            return self.finish('academic_resources')
+        elif "courses overload" in tags:
+            return self.finish('course_overload_response')
+        elif "specific events" in tags:
+            return self.go_to_state("specific_event_response")
+        elif "help" in tags or "hi" in tags:
+            return self.go_to_state('greeting')
+        elif "no" in tags and self.finish_flag:
+            return self.finish("cant_help")
+        else:
+            return self.go_to_state("confused")
+
+    @goes_to(
+        'anxious_breathe',
+        'clubs',
+        'confused',
+        'finish_academic_resources',
+        'finish_course_overload_response',
+        'finish_health_resources',
+        'greeting',
+        'suicidal_response_friends',
+        'talk_to_professors',
+        'why_sad',
+    )
+    def respond_from_figure_out_feelings(self, message, tags):
+        if "sad" in tags or "yes" in tags or "no" in tags:
+            return self.go_to_state('why_sad')
+        elif "suicidal" in tags:
+            return self.go_to_state('suicidal_response_friends')
+        elif "anxious" in tags:
+            return self.go_to_state('anxious_breathe')
+        elif "social isolation" in tags:
+            return self.go_to_state("clubs")
+        elif "idk" in tags:
+            return self.go_to_state("why_sad")
+        elif 'health issues' in tags:
+            return self.finish('health_resources')
+        elif 'failing academics' in tags:
+            return self.go_to_state("talk_to_professors")
+        elif "difficult courses" in tags:
+            return self.finish('academic_resources')
+        elif "courses overload" in tags:
+            return self.finish('course_overload_response')
+        elif "help" in tags or "hi" in tags:
+            return self.go_to_state('greeting')
+        else:
+            return self.go_to_state("confused")
+
+    @goes_to(
+        'confused',
+        'finish_join_clubs',
+        'finish_should_join_club',
+        'why_not',
+    )
+    def respond_from_clubs(self, message, tags):
+        if 'no' in tags:
+            return self.go_to_state('why_not')
+        elif 'yes' in tags:
+            return self.finish('join_clubs')
+        elif 'idk' in tags:
+            return self.finish('should_join_club')
+        else:
+            return self.go_to_state("confused")
+
+    @goes_to(
+        'anxious_breathe',
+        'clubs',
+        'confused',
+        'figure_out_feelings',
+        'finish_academic_resources',
+        'finish_cant_help',
+        'finish_course_overload_response',
+        'finish_good_response',
+        'finish_health_resources',
+        'finish_thanks',
+        'greeting',
+        'specific_event_response',
+        'suicidal_response_friends',
+        'talk_to_professors',
+        'why_sad',
+    )
+    def respond_from_why_not(self, message, tags):
+        if "sad" in tags:
+            return self.go_to_state('why_sad')
+        elif "good" in tags:
+            return self.finish("good_response")
+        elif "suicidal" in tags:
+            return self.go_to_state('suicidal_response_friends')
+        elif "anxious" in tags:
+            return self.go_to_state('anxious_breathe')
+        elif "thanks" in tags and self.finish_flag:
+            return self.finish("thanks")
+        elif "thanks" in tags and not self.finish_flag:
+            return self.go_to_state("confused")
+        elif "idk" in tags:
+            return self.go_to_state("figure_out_feelings")
+        elif 'health issues' in tags:
+            return self.finish('health_resources')
+        elif "difficult courses" in tags:
+            return self.finish('academic_resources')
+        elif 'failing academics' in tags:
+            return self.go_to_state("talk_to_professors")
+        elif "social isolation" in tags:
+            return self.go_to_state("clubs")
+        elif "courses overload" in tags:
+            return self.finish('course_overload_response')
+        elif "specific events" in tags:
+            return self.go_to_state("specific_event_response")
+        elif "help" in tags or "hi" in tags:
+            return self.go_to_state('greeting')
+        elif "no" in tags and self.finish_flag:
+            return self.finish("cant_help")
+        else:
+            return self.go_to_state("confused")
+
+    @goes_to('confused', 'finish_talk_to_them', 'other_factors')
+    def respond_from_talk_to_professors(self, messsage, tags):
+        if 'no' in tags:
+            return self.finish('talk_to_them')
+        elif 'yes' in tags:
+            return self.go_to_state('other_factors')
+        else:
+            return self.go_to_state("confused")
+
+    @goes_to(
+        'anxious_breathe',
+        'clubs',
+        'confused',
+        'figure_out_feelings',
+        'finish_academic_resources',
+        'finish_cant_help',
+        'finish_course_overload_response',
+        'finish_good_response',
+        'finish_health_resources',
+        'finish_thanks',
+        'greeting',
+        'specific_event_response',
+        'suicidal_response_friends',
+        'why_sad',
+    )
+    def respond_from_other_factors(self, message, tags):
+        if "sad" in tags:
+            return self.go_to_state('why_sad')
+        elif "good" in tags:
+            return self.finish("good_response")
+        elif "suicidal" in tags:
+            return self.go_to_state('suicidal_response_friends')
+        elif "anxious" in tags:
+            return self.go_to_state('anxious_breathe')
+        elif "thanks" in tags and self.finish_flag:
+            return self.finish("thanks")
+        elif "thanks" in tags and not self.finish_flag:
+            return self.go_to_state("confused")
+        elif "idk" in tags:
+            return self.go_to_state("figure_out_feelings")
+        elif "social isolation" in tags:
+            return self.go_to_state("clubs")
+        elif 'health issues' in tags:
+            return self.finish('health_resources')
+        elif "difficult courses" in tags:
+            return self.finish('academic_resources')
+        elif "courses overload" in tags:
+            return self.finish('course_overload_response')
+        elif "specific events" in tags:
+            return self.go_to_state("specific_event_response")
+        elif "help" in tags or "hi" in tags:
+            return self.go_to_state('greeting')
+        elif "no" in tags and self.finish_flag:
+            return self.finish("cant_help")
+        else:
+            return self.go_to_state("confused")
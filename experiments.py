@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""A/B tests of alternative wordings of a chatbot's responses.
+
+An Experiment replaces one `on_enter_*` method of a chatbot with a choice
+between the current response (the "control" variant) and some alternative
+texts. Each conversation is assigned a variant by hashing its id, so it
+always sees the same wording without a table of assignments to keep or look
+up, and the variant texts are written out in full up front. When a
+conversation that has seen a variant next finishes, the `finish_*` manner it
+reached is counted against that variant; conversations that are forgotten
+before they finish are counted as ABANDONED.
+
+`finish_*` methods cannot be varied: a finish is counted against the
+variants seen before it, so a varied finish would only be measured by the
+finish after it, which users who leave never reach.
+"""
+
+from array import array
+from zlib import crc32
+
+ABANDONED = 'abandoned'
+
+
+class Experiment:
+    """Try other wordings of one of a chatbot's responses."""
+
+    def __init__(self, name, method, variants):
+        """Initialize an Experiment.
+
+        Arguments:
+            name (str): The name of the experiment; it also seeds the
+                assignment, so renaming it reshuffles conversations.
+            method (str): The `on_enter_*` method to vary.
+            variants (Dict[str, str]): The text of each alternative variant.
+                The method's own response is the "control" variant.
+        """
+        self.name = name
+        self.method = method
+        self.variants = ['control'] + list(variants)
+        self.texts = [None] + list(variants.values())
+        self.size = len(self.variants)
+        self.seed = crc32(name.encode('utf-8'))
+        self.original = None
+        self.manners = []
+        self.outcomes = {}
+        self.width = 0
+        self.counts = array('L')
+
+    def bind(self, cls):
+        """Replace the method of a chatbot class with this experiment.
+
+        Arguments:
+            cls (class): The chatbot class.
+
+        Raises:
+            ValueError: If the method is not an `on_enter_*` method.
+        """
+        if not self.method.startswith('on_enter_'):
+            raise ValueError(f'experiment {self.name} varies {self.method}, not an on_enter_* method')
+        original = self.original = getattr(cls, self.method)
+        self.manners = sorted(
+            name[len('finish_'):] for name in dir(cls)
+            if name.startswith('finish_') and callable(getattr(cls, name))
+        ) + [ABANDONED]
+        self.outcomes = {manner: i for i, manner in enumerate(self.manners)}
+        self.width = len(self.manners)
+        self.counts = array('L', [0] * (len(self.variants) * self.width))
+
+        texts = self.texts
+        assign = self.assign
+
+        def respond(bot):
+            text = texts[assign(bot)]
+            return original(bot) if text is None else text
+
+        respond.__name__ = original.__name__
+        respond.__doc__ = original.__doc__
+        setattr(cls, self.method, respond)
+
+    def assign(self, bot):
+        """Find the variant a chatbot's conversation sees.
+
+        Arguments:
+            bot (ChatBot): The chatbot.
+
+        Returns:
+            int: The index of the variant.
+        """
+        exposures = bot.exposures
+        if exposures is None:
+            exposures = bot.exposures = {}
+        variant = exposures.get(self)
+        if variant is None:
+            variant = exposures[self] = self.variant_of(bot.conversation)
+        return variant
+
+    def variant_of(self, conversation):
+        """Find the variant a conversation is assigned.
+
+        Arguments:
+            conversation (Union[str, Tuple[str, ...]]): The id of the
+                conversation.
+
+        Returns:
+            int: The index of the variant.
+        """
+        key = '\x1f'.join(conversation) if type(conversation) is tuple else str(conversation)
+        return crc32(key.encode('utf-8'), self.seed) % self.size
+
+    def record(self, variant, manner):
+        """Count the finish reached by a conversation that saw a variant.
+
+        Arguments:
+            variant (int): The index of the variant.
+            manner (str): The `finish_<manner>` reached, or ABANDONED.
+        """
+        column = self.outcomes.get(manner)
+        if column is not None:
+            self.counts[variant * self.width + column] += 1
+
+    def results(self):
+        """Count the finishes reached after each variant.
+
+        Returns:
+            Dict[str, Dict[str, int]]: The number of conversations that
+                reached each manner of finish, for each variant.
+        """
+        width = self.width
+        return {
+            variant: {
+                manner: self.counts[i * width + j]
+                for j, manner in enumerate(self.manners)
+                if self.counts[i * width + j]
+            }
+            for i, variant in enumerate(self.variants)
+        }
+
+    def report(self):
+        """Summarize the results of the experiment.
+
+        Returns:
+            str: For each variant, how many conversations ended after seeing
+                it, and what share of them reached each manner of finish or
+                were abandoned, most common first.
+        """
+        lines = [f'experiment {self.name} ({self.method}):']
+        for variant, counts in self.results().items():
+            total = sum(counts.values())
+            shares = ', '.join(
+                f'{counts[manner] / total:.0%} {manner}'
+                for manner in sorted(counts, key=counts.get, reverse=True)
+            )
+            lines.append(f'  {variant:>16}: {total:6d} ended{": " if shares else ""}{shares}')
+        return '\n'.join(lines)
+
+
+def abandon(bot):
+    """Count a chatbot that is being forgotten before it finished.
+
+    Arguments:
+        bot (ChatBot): The chatbot.
+    """
+    if bot.exposures:
+        for experiment, variant in bot.exposures.items():
+            experiment.record(variant, ABANDONED)
+        bot.exposures = None
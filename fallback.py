@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""A small statistical classifier for messages that match no TAGS.
+
+Messages are turned into hashed word, word-pair and character trigram
+features, and scored with a linear model trained offline by
+`train_fallback.py`. Character trigrams let it recognize misspelled words
+("overwhelmd", "lonley") that the keyword TAGS miss. Besides the tags, the
+model has a NO_TAG class, trained on small talk and noise, so that messages
+unlike any tag are left alone instead of going to the nearest one.
+"""
+
+import json
+import math
+import re
+from collections import Counter
+from time import perf_counter
+from zlib import crc32
+
+from normalize import normalize
+
+WORD = re.compile(r"[a-z']+")
+NO_TAG = ''
+
+
+def features(message, buckets):
+    """Hash the features of a message.
+
+    Arguments:
+        message (Union[str, normalize.Message]): The message from the user.
+        buckets (int): The number of hash buckets; must be a power of two.
+
+    Returns:
+        List[int]: The bucket of each feature.
+    """
+    words = WORD.findall(normalize(message).text)
+    mask = buckets - 1
+    return [crc32(name.encode('utf-8')) & mask for name in _feature_names(words)]
+
+
+def _feature_names(words):
+    """Generate the names of the features of some words one at a time."""
+    for word in words:
+        yield 'w:' + word
+    for first, second in zip(words, words[1:]):
+        yield f'b:{first} {second}'
+    for word in words:
+        padded = f'<{word}>'
+        for i in range(len(padded) - 2):
+            yield 'c:' + padded[i:i + 3]
+
+
+class FallbackClassifier:
+    """Guess the tag of a message from a trained linear model.
+
+    The model file is only read the first time a message is classified, so
+    configuring a classifier does not slow down startup. The classifier keeps
+    count of how often it is called, how often it finds a tag, and how long it
+    takes.
+    """
+
+    def __init__(self, filename):
+        """Initialize a FallbackClassifier.
+
+        Arguments:
+            filename (str): The JSON model written by `train_fallback.py`.
+        """
+        self.filename = filename
+        self.model = None
+        self.calls = 0
+        self.hits = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def load(self):
+        """Read the model file."""
+        with open(self.filename) as model_file:
+            model = json.load(model_file)
+        self.buckets = model['buckets']
+        self.classes = model['classes']
+        self.threshold = model['threshold']
+        self.bias = model['bias']
+        self.weights = {
+            int(bucket): weights for bucket, weights in model['weights'].items()
+        }
+        self.model = model
+
+    def probabilities(self, message):
+        """Score a message against every class.
+
+        Arguments:
+            message (Union[str, normalize.Message]): The message from the user.
+
+        Returns:
+            List[float]: The probability of each class.
+        """
+        if self.model is None:
+            self.load()
+        scores = list(self.bias)
+        for bucket in features(message, self.buckets):
+            weights = self.weights.get(bucket)
+            if weights is not None:
+                for i, weight in enumerate(weights):
+                    scores[i] += weight
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [exp / total for exp in exps]
+
+    def classify(self, message):
+        """Guess the tag of a message.
+
+        Arguments:
+            message (Union[str, normalize.Message]): The message from the user.
+
+        Returns:
+            Dict[str, int]: The guessed tag, or nothing if the model is not
+                confident enough or thinks the message has no tag.
+        """
+        if self.model is None:
+            self.load()
+        start = perf_counter()
+        probabilities = self.probabilities(message)
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        tags = Counter()
+        if probabilities[best] >= self.threshold and self.classes[best] != NO_TAG:
+            tags[self.classes[best]] = 1
+            self.hits += 1
+        elapsed = perf_counter() - start
+        self.calls += 1
+        self.seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        return tags
+
+    def stats(self):
+        """Summarize how the classifier has performed so far.
+
+        Returns:
+            str: The number of calls, the hit rate and the mean and maximum
+                time per call.
+        """
+        if not self.calls:
+            return 'fallback classifier: not called'
+        return ' '.join([
+            f'fallback classifier: {self.calls} calls,',
+            f'{self.hits / self.calls:.0%} hit rate,',
+            f'{self.seconds / self.calls * 1e6:.0f} us mean,',
+            f'{self.max_seconds * 1e6:.0f} us max',
+        ])
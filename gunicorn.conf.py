@@ -0,0 +1,30 @@
+"""Settings for serving `service:app` with gunicorn.
+
+The app is loaded once, before the workers are forked, so the chatbot's
+lexicons, router and state graph are built once and shared by every worker
+(copy-on-write) instead of each worker building its own. The number of
+workers is read from WEB_CONCURRENCY, and the port from PORT.
+"""
+
+import gc
+from os import environ
+
+bind = f'0.0.0.0:{environ.get("PORT", 8000)}'
+workers = int(environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'sync'
+preload_app = True
+timeout = 30
+graceful_timeout = 10
+max_requests = int(environ.get('MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    """Move everything loaded so far out of the garbage collector's sight.
+
+    The collector writes to every object it tracks, which would copy the
+    pages the workers share into each of them; frozen objects are never
+    collected, so those pages stay shared. gc.freeze is new in Python 3.7.
+    """
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""A bounded queue of incoming messages that sheds load when it backs up."""
+
+from collections import deque
+
+
+class Intake:
+    """Queue incoming messages, turning some away while the queue is too long.
+
+    Messages are queued as they are read from Slack and answered from the
+    queue, so a burst of messages or slow replies make the queue grow instead
+    of the chatbot falling behind on reading. Once `high` messages are
+    waiting, new messages are shed (turned away, some with a short "busy" reply)
+    until the queue is down to `low`, so the chatbot does not flip between
+    shedding and not on every message.
+
+    Each conversation is told it was turned away at most once while
+    shedding, and at most `busy_rate` conversations a second are told, since
+    posting a busy reply takes about as long as posting a real one.
+
+    Messages taken off the queue but not answered yet, eg. fragments waiting
+    in a `turns.TurnAggregator`, still count towards its length if `holding`
+    is set to a function that counts them, so they cannot pile up unbounded
+    behind the queue.
+
+    Crisis messages are never shed: those with a crisis tag, and all
+    messages of conversations that `in_crisis` (if set to a function of a
+    conversation) says are in a crisis, whatever their tags, since a reply
+    like "no" to "do you have anyone to talk to?" has none. Messages are only tagged while shedding, and those
+    tags are kept with the message so it is not tagged again. Crisis messages
+    go on a queue of their own that `get` empties first, along with any
+    messages of the same conversation already waiting, so they are not held
+    up behind hundreds of others and the conversation is answered in order.
+
+    The depth of the queue and how many messages were admitted and shed are
+    counted; `stats` summarizes them.
+    """
+
+    def __init__(self, high=500, low=None, tagger=None, crisis_tags=(), busy_rate=5.0):
+        """Initialize an Intake.
+
+        Arguments:
+            high (int): The queue length at which shedding starts.
+            low (int): The queue length at which shedding stops; half of
+                `high` by default.
+            tagger (Callable[[str], Dict[str, int]]): Counts the tags of a
+                message, usually a chatbot's `_get_tags`. Optional.
+            crisis_tags (Iterable[str]): Tags of messages that must never be
+                shed.
+            busy_rate (float): The most busy replies to send a second.
+        """
+        self.high = high
+        self.low = high // 2 if low is None else low
+        self.tagger = tagger
+        self.crisis_tags = frozenset(crisis_tags)
+        self.queue = deque()
+        self.urgent = deque()
+        self.holding = None
+        self.in_crisis = None
+        self.shedding = False
+        self.told = set()
+        self.busy_rate = busy_rate
+        self.busy_allowance = busy_rate
+        self.busy_checked = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.crises = 0
+        self.episodes = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.queue) + len(self.urgent)
+
+    def depth(self):
+        """Count the messages waiting to be answered.
+
+        Returns:
+            int: The messages on the queues, and those held after them.
+        """
+        if self.holding is None:
+            return len(self)
+        return len(self) + self.holding()
+
+    def put(self, key, message):
+        """Queue a message, unless it has to be shed.
+
+        Arguments:
+            key (Hashable): The conversation the message belongs to.
+            message (str): The message from the user.
+
+        Returns:
+            bool: True if the message was queued, False if it was shed.
+        """
+        tags = None
+        depth = self.depth()
+        if self.shedding and depth <= self.low:
+            self.stop_shedding()
+        elif not self.shedding and depth >= self.high:
+            self.shedding = True
+            self.episodes += 1
+        crisis = self.in_crisis is not None and self.in_crisis(key)
+        if self.shedding and not crisis:
+            if self.tagger is not None and self.crisis_tags:
+                tags = self.tagger(message)
+            crisis = bool(tags) and not self.crisis_tags.isdisjoint(tags)
+            if not crisis:
+                self.shed += 1
+                return False
+        if crisis:
+            if self.shedding:
+                self.crises += 1
+            if self.queue and any(queued[0] == key for queued in self.queue):
+                self.urgent.extend(queued for queued in self.queue if queued[0] == key)
+                self.queue = deque(queued for queued in self.queue if queued[0] != key)
+            self.urgent.append((key, message, tags))
+        else:
+            self.queue.append((key, message, tags))
+        self.admitted += 1
+        self.max_depth = max(self.max_depth, depth + 1)
+        return True
+
+    def get(self):
+        """Take the next message off the queues, oldest crisis message first.
+
+        Returns:
+            Tuple[Hashable, str, Dict[str, int]]: The conversation and the
+                message, and its tags if they were counted (or None).
+        """
+        item = self.urgent.popleft() if self.urgent else self.queue.popleft()
+        if self.shedding and self.depth() <= self.low:
+            self.stop_shedding()
+        return item
+
+    def stop_shedding(self):
+        """Let messages in again, and forget who was told about it."""
+        self.shedding = False
+        self.told.clear()
+
+    def tell_busy(self, key, now):
+        """Check whether a conversation should be told that the chatbot is busy.
+
+        Arguments:
+            key (Hashable): The conversation whose message was shed.
+            now (float): The current time, in seconds.
+
+        Returns:
+            bool: True if a busy reply should be sent: the conversation has
+                not been told yet while shedding, and fewer than `busy_rate`
+                busy replies have been sent in the last second.
+        """
+        if key in self.told:
+            return False
+        self.busy_allowance = min(
+            self.busy_rate,
+            self.busy_allowance + (now - self.busy_checked) * self.busy_rate,
+        )
+        self.busy_checked = now
+        if self.busy_allowance < 1:
+            return False
+        self.busy_allowance -= 1
+        self.told.add(key)
+        return True
+
+    def stats(self):
+        """Summarize the intake so far.
+
+        Returns:
+            str: The queue depth, and how many messages were admitted, shed,
+                and let through while shedding because of a crisis.
+        """
+        return ' '.join([
+            f'intake: {self.depth()} queued ({self.max_depth} max),',
+            f'{self.admitted} admitted, {self.shed} shed in {self.episodes} episodes,',
+            f'{self.crises} crisis messages let through',
+            '(shedding)' if self.shedding else '',
+        ]).rstrip()
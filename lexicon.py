@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""A precompiled index of TAGS phrases."""
+
+from collections import Counter
+
+from locales import HAN_CHARACTER, detect_all
+from normalize import HAN, clean, normalize, pattern, tokenize
+
+# Like normalize.HAN_TOKEN, but keeps each run of Han characters together
+HAN_RUN_TOKEN = f'([{HAN}]+)|([^\\W{HAN}]+|[^\\w\\s])'
+
+
+def _continues(tokens, start, words):
+    """Check whether the tokens from `start` on begin with `words`.
+
+    This compares in place rather than slicing, which would copy the tokens.
+    """
+    if start + len(words) > len(tokens):
+        return False
+    for word in words:
+        if tokens[start] != word:
+            return False
+        start += 1
+    return True
+
+
+def _longest_words(run, pieces, backward):
+    """Split a run of Han characters by taking the longest word at each step.
+
+    Arguments:
+        run (str): The characters.
+        pieces (Dict[str, bool]): Whether each prefix (or, going backward,
+            suffix) of a known word is a word itself.
+        backward (bool): Whether to take words from the end of the run.
+
+    Returns:
+        List[str]: The words of the run, in order; characters that start no
+            known word are words of their own.
+    """
+    found = []
+    start, end = 0, len(run)
+    while start < end:
+        if backward:
+            cut = end - 1
+            i = cut - 1
+            while i >= start:
+                is_word = pieces.get(run[i:end])
+                if is_word is None:
+                    break
+                if is_word:
+                    cut = i
+                i -= 1
+            found.append(run[cut:end])
+            end = cut
+        else:
+            cut = start + 1
+            i = cut + 1
+            while i <= end:
+                is_word = pieces.get(run[start:i])
+                if is_word is None:
+                    break
+                if is_word:
+                    cut = i
+                i += 1
+            found.append(run[start:cut])
+            start = cut
+    if backward:
+        found.reverse()
+    return found
+
+
+def segment(run, prefixes, suffixes):
+    """Split a run of Han characters into words.
+
+    Chinese is written without spaces, so this uses bidirectional maximum
+    matching: the run is split by taking the longest known word from the
+    start and from the end, and the split with fewer words wins, then the one
+    with fewer single characters. Ties go to the split from the end, which is
+    right more often (我很难过 is 我/很/难过, not 我/很难/过).
+
+    Arguments:
+        run (str): The characters.
+        prefixes (Dict[str, bool]): Whether each prefix of a known word is a
+            word itself.
+        suffixes (Dict[str, bool]): Whether each suffix of a known word is a
+            word itself.
+
+    Returns:
+        List[str]: The words of the run.
+    """
+    if len(run) == 1:
+        return [run]
+    forward = _longest_words(run, prefixes, False)
+    backward = _longest_words(run, suffixes, True)
+    if len(forward) != len(backward):
+        return forward if len(forward) < len(backward) else backward
+    singles_forward = sum(1 for word in forward if len(word) == 1)
+    singles_backward = sum(1 for word in backward if len(word) == 1)
+    return forward if singles_forward < singles_backward else backward
+
+
+class Lexicon:
+    """Find the TAGS phrases in a message with a single pass over its tokens.
+
+    Every phrase is indexed by its first token, so a message is tokenized
+    once and each of its tokens is looked up once, instead of searching the
+    message with a regular expression per phrase. A phrase matches where its
+    tokens appear next to each other in the message, which is the same as
+    searching for it between word boundaries (`\\b`).
+
+    Chinese has no spaces to mark word boundaries, so normalization makes
+    every Han character a token. If the lexicon has Chinese phrases, each run
+    of Han characters is segmented into words (see `segment`) before it is
+    matched, using the phrases themselves and a list of other words as the
+    dictionary. Phrases then only match whole words: 难过 in 我很难过 is not
+    taken for 很难, and 想 does not match inside 不想 or 想死.
+
+    Short replies ("yes", "ok", "idk") are very common, so the tags of recent
+    messages are cached by their normalized text. The cached counters are
+    shared, so callers must not modify the tags they are given.
+    """
+
+    CACHE_SIZE = 4096
+
+    def __init__(self, tags, weights=None, words=()):
+        """Compile a lexicon.
+
+        Arguments:
+            tags (Dict[str, Union[str, List[str]]]): The tags of each phrase.
+            weights (Dict[str, float]): The weight of some phrases; the rest
+                weigh 1.
+            words (Iterable[str]): Chinese words without tags, to keep whole
+                when segmenting so that phrases do not match inside them.
+        """
+        weights = weights or {}
+        self.index = {}
+        self.cache = {}
+        # Every prefix and suffix of a Chinese word, and whether it is a word
+        # itself, so segmenting stops looking as soon as no word can match
+        self.prefixes = {}
+        self.suffixes = {}
+        han = pattern(HAN_CHARACTER)
+        for word in list(tags) + list(words):
+            if not word or not all(han.match(character) for character in word):
+                continue
+            for i in range(1, len(word)):
+                self.prefixes.setdefault(word[:i], False)
+                self.suffixes.setdefault(word[-i:], False)
+            self.prefixes[word] = self.suffixes[word] = True
+        for phrase, phrase_tags in tags.items():
+            tokens = self.tokens(clean(phrase)) if self.prefixes else tokenize(phrase)
+            if not tokens:
+                continue
+            if isinstance(phrase_tags, str):
+                phrase_tags = [phrase_tags]
+            self.index.setdefault(tokens[0], []).append((
+                phrase,
+                tuple(tokens[1:]),
+                tuple(phrase_tags),
+                weights.get(phrase, 1),
+            ))
+
+    def tokens(self, text):
+        """Split clean text into tokens, segmenting Chinese into words.
+
+        Arguments:
+            text (str): The clean text (see `normalize.clean`).
+
+        Returns:
+            List[str]: The tokens of the text, with each run of Han
+                characters split into words.
+        """
+        tokens = []
+        for run, token in pattern(HAN_RUN_TOKEN).findall(text):
+            if run:
+                tokens.extend(segment(run, self.prefixes, self.suffixes))
+            else:
+                tokens.append(token)
+        return tokens
+
+    def match(self, message):
+        """Count the tags of the phrases found in a message.
+
+        Each phrase is counted at most once, however often it appears.
+
+        Arguments:
+            message (Union[str, normalize.Message]): The message from the
+                user.
+
+        Returns:
+            Dict[str, float]: The weighted count of each tag.
+        """
+        message = normalize(message)
+        counter = self.cache.get(message.text)
+        if counter is not None:
+            return counter
+        counter = Counter()
+        tokens = self.tokens(message.text) if self.prefixes else message.tokens
+        seen = None
+        for i, token in enumerate(tokens):
+            entries = self.index.get(token)
+            if entries is None:
+                continue
+            for phrase, rest, tags, weight in entries:
+                if rest and not _continues(tokens, i + 1, rest):
+                    continue
+                if seen is None:
+                    seen = set()
+                elif phrase in seen:
+                    continue
+                seen.add(phrase)
+                for tag in tags:
+                    counter[tag] += weight
+        if len(self.cache) >= self.CACHE_SIZE:
+            self.cache.clear()
+        self.cache[message.text] = counter
+        return counter
+
+
+class LocalizedLexicon:
+    """Find TAGS phrases using the lexicon of each message's locale.
+
+    The locale of each message is detected (see `locales.detect`) and its
+    phrases are matched with that locale's lexicon, which holds the default
+    (English) TAGS as well, since messages often mix languages. A message
+    with words of other locales too ("i'm so sad, quiero morir") is also
+    matched with their lexicons, so a crisis phrase is found whichever
+    language it is in. A locale's lexicon is only read and compiled the
+    first time a message in it is seen, so locales that are never used take
+    no memory, and a message in one language is only matched against one
+    lexicon however many locales there are.
+    """
+
+    def __init__(self, tags, weights=None, locales=None):
+        """Compile the default lexicon.
+
+        Arguments:
+            tags (Dict[str, Union[str, List[str]]]): The tags of each phrase
+                in the default locale.
+            weights (Dict[str, float]): The weight of some of those phrases.
+            locales (Dict[str, str]): The lexicon file of each other locale: a
+                JSON object with the "tags" of its phrases and, optionally,
+                their "weights", in the same form as `tags` and `weights`,
+                and a list of untagged "words" (see `Lexicon`).
+        """
+        self.tags = tags
+        self.weights = weights or {}
+        self.files = locales or {}
+        self.default = Lexicon(tags, weights)
+        self.lexicons = {}
+
+    def lexicon(self, locale):
+        """Find the lexicon of a locale, compiling it if needed.
+
+        Arguments:
+            locale (str): The locale, or None for the default one.
+
+        Returns:
+            Lexicon: The lexicon of the locale, or the default lexicon if the
+                locale has none.
+        """
+        lexicon = self.lexicons.get(locale)
+        if lexicon is None:
+            if locale not in self.files:
+                return self.default
+            tags, weights, words = self.load(locale)
+            lexicon = self.lexicons[locale] = Lexicon(
+                dict(self.tags, **tags), dict(self.weights, **weights), words)
+        return lexicon
+
+    def load(self, locale):
+        """Read the lexicon file of a locale.
+
+        Arguments:
+            locale (str): The locale.
+
+        Returns:
+            Dict[str, Union[str, List[str]]]: The tags of each phrase.
+            Dict[str, float]: The weight of some phrases.
+            List[str]: Words without tags, to keep whole when segmenting.
+        """
+        import json
+        with open(self.files[locale], encoding='utf-8') as lexicon_file:
+            lexicon = json.load(lexicon_file)
+        return lexicon['tags'], lexicon.get('weights', {}), lexicon.get('words', [])
+
+    def match(self, message):
+        """Count the tags of the phrases found in a message.
+
+        Arguments:
+            message (Union[str, normalize.Message]): The message from the
+                user.
+
+        Returns:
+            Dict[str, float]: The weighted count of each tag.
+        """
+        message = normalize(message)
+        locales = detect_all(message)
+        counter = self.lexicon(locales[0]).match(message)
+        for locale in locales[1:]:
+            # Each lexicon holds the default TAGS too, so take the larger
+            # count of each tag instead of adding them up
+            other = self.lexicon(locale).match(message)
+            if any(count > counter.get(tag, 0) for tag, count in other.items()):
+                counter = Counter(counter)
+                for tag, count in other.items():
+                    counter[tag] = max(counter[tag], count)
+        return counter
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""Load test the Slack chatbot with simulated users and a fake Slack.
+
+Simulated users arrive at a given rate and each hold a multi-turn
+conversation with the chatbot, waiting for every reply and "thinking" before
+they answer. Their messages are written on the fly from the chatbot's own
+STATES, TAGS and ROUTES, by walking the state graph with a private copy of the
+chatbot. The messages go through `slackbot.run` against an in-process fake of
+Slack's RTM and Web APIs, so the whole receive/respond/post path is exercised.
+
+Every report interval, a line with the throughput, reply latency percentiles,
+memory use, conversation state still held by the chatbot, and the depth of its
+intake queue and the messages it shed is written to stderr. Users whose
+message is shed retry it after thinking, or after --patience seconds without
+an answer. To test overload, make posting slow with --post-delay; shed
+messages that would take a new conversation into one of the chatbot's
+CRISIS_STATES, or that belong to a conversation already in one, are counted
+under "crisis", which should stay 0. The generator
+itself only keeps its active users and fixed-size latency histograms, so its
+memory stays flat during long soak runs.
+
+`slackbot.run` prints every event, so redirect stdout:
+
+    python3 loadgen.py --rate 20 --duration 3600 > /dev/null
+"""
+
+import argparse
+import heapq
+import math
+import os
+import random
+import sys
+import threading
+from collections import deque
+from time import perf_counter, sleep
+
+import slackbot
+from intake import Intake
+from oxycsbot import OxyCSBot
+
+BOT_ID = 'UBOT'
+
+FILLERS = [
+    '{}',
+    'i guess {}',
+    'honestly {}',
+    '{} i think',
+    'um, {}',
+    'well... {}',
+    'idk how to say this but {}',
+    '{} lately',
+]
+
+GIBBERISH = [
+    'asdfgh',
+    'purple monkey dishwasher',
+    'lol',
+    '...',
+    'what',
+    'brb',
+]
+
+
+class FakeSlack:
+    """An in-process stand-in for SlackClient.
+
+    Events are queued with `send` and handed to the chatbot by `rtm_read`;
+    `chat.postMessage` calls are queued as replies with the time they were
+    posted and whether they were a busy reply. Both queues are deques, so the
+    load generator and the chatbot can use them from different threads.
+    """
+
+    def __init__(self, post_delay=0.0):
+        """Initialize a FakeSlack.
+
+        Arguments:
+            post_delay (float): Seconds each `chat.postMessage` takes.
+        """
+        self.events = deque()
+        self.replies = deque()
+        self.post_delay = post_delay
+
+    def connect(self):
+        """Stand in for `slackbot.connect_to_slack`."""
+        return self, BOT_ID
+
+    def send(self, channel, user, message):
+        """Queue an @-message to the chatbot."""
+        self.events.append({
+            'type': 'message',
+            'channel': channel,
+            'user': user,
+            'text': f'<@{BOT_ID}> {message}',
+        })
+
+    def rtm_read(self):
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def api_call(self, method, **kwargs):
+        if method == 'chat.postMessage':
+            if self.post_delay:
+                sleep(self.post_delay)
+            busy = kwargs['text'] == OxyCSBot.BUSY_RESPONSE
+            self.replies.append((kwargs['channel'], perf_counter(), busy))
+        return {'ok': True}
+
+
+class ScriptWriter:
+    """Write realistic user messages by walking the chatbot's state graph."""
+
+    def __init__(self, bot_class, rng, confusion=0.1, max_turns=12):
+        """Initialize a ScriptWriter.
+
+        Arguments:
+            bot_class (class): The chatbot class whose graph to walk.
+            rng (random.Random): The source of randomness.
+            confusion (float): The chance of a message matching no tags.
+            max_turns (int): The most messages in one conversation.
+        """
+        self.bot_class = bot_class
+        # The simulator must not count towards the real chatbot's
+        # experiments or write to its transition log, which are both kept
+        # on the class
+        self.simulator_class = type(f'Simulated{bot_class.__name__}', (bot_class,), dict(
+            {experiment.method: experiment.original for experiment in bot_class.EXPERIMENTS},
+            EXPERIMENTS=[],
+            transition_log=None,
+        ))
+        self.rng = rng
+        self.confusion = confusion
+        self.max_turns = max_turns
+        self.phrases = {}
+        for phrase, tags in bot_class.TAGS.items():
+            for tag in [tags] if isinstance(tags, str) else tags:
+                self.phrases.setdefault(tag, []).append(phrase)
+
+    def script(self):
+        """Write one conversation, a message at a time.
+
+        A private chatbot answers each message, so the next message can be
+        written for the state the real chatbot will be in. It is of a
+        subclass without the chatbot's EXPERIMENTS and transition log.
+
+        Yields:
+            str: The next message of the conversation.
+        """
+        simulator = self.simulator_class()
+        routes = self.bot_class.ROUTES
+        for _ in range(self.max_turns):
+            state = simulator.state
+            if state == 'confused':
+                state = simulator.prev_state
+            rules = routes.get(state) or routes[simulator.default_state]
+            tag = self.rng.choice(rules)[0]
+            if self.rng.random() < self.confusion or tag not in self.phrases:
+                message = self.rng.choice(GIBBERISH)
+            else:
+                phrase = self.rng.choice(self.phrases[tag])
+                message = self.rng.choice(FILLERS).format(phrase)
+            yield message
+            simulator.respond(message)
+            if simulator.state == simulator.default_state:
+                return
+
+
+class LatencyHistogram:
+    """Count latencies in log-spaced buckets, from 1 us to 100 s."""
+
+    PER_DECADE = 20
+    DECADES = 8
+
+    def __init__(self):
+        self.counts = [0] * (self.PER_DECADE * self.DECADES + 1)
+        self.total = 0
+
+    def add(self, seconds):
+        """Count one latency."""
+        bucket = int(math.log10(max(seconds, 1e-6) / 1e-6) * self.PER_DECADE)
+        self.counts[min(bucket, len(self.counts) - 1)] += 1
+        self.total += 1
+
+    def percentile(self, fraction):
+        """Estimate a latency percentile.
+
+        Arguments:
+            fraction (float): The percentile, eg. 0.99.
+
+        Returns:
+            float: The upper edge of the bucket holding it, in seconds.
+        """
+        if not self.total:
+            return 0.0
+        rank = fraction * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+        return 1e-6 * 10 ** ((bucket + 1) / self.PER_DECADE)
+
+
+class User:
+    """A simulated user holding one conversation."""
+
+    __slots__ = ('channel', 'name', 'script', 'sent_at', 'message', 'retry')
+
+    def __init__(self, number, script):
+        self.channel = f'C{number}'
+        self.name = f'U{number}'
+        self.script = script
+        self.sent_at = None
+        self.message = None
+        self.retry = False
+
+
+def resident_memory():
+    """Find the resident memory of this process.
+
+    Returns:
+        int: The resident set size in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def conversation_leaks(bots, active_channels, default_state):
+    """Count the chatbots held for users who have left.
+
+    Chatbots are held until CONVERSATION_TIMEOUT after the user's last
+    message, so "stale" should level off; "leaked" counts conversations
+    abandoned part way through.
+
+    Returns:
+        int: Chatbots held for conversations that are over.
+        int: Of those, how many were left outside the default state.
+    """
+    held = list(bots.items())
+    stale = [bot for (channel, _), bot in held if channel not in active_channels]
+    return len(stale), sum(1 for bot in stale if bot.state != default_state)
+
+
+def routes_to_crisis(bot_class, tags):
+    """Check if a message would start a crisis conversation.
+
+    This routes the message instead of looking at the intake's crisis tags,
+    so tags missing from those are counted too.
+
+    Arguments:
+        bot_class (class): The chatbot class.
+        tags (Dict[str, float]): The tags of the message.
+
+    Returns:
+        bool: True if the message goes to one of the CRISIS_STATES from the
+            default state.
+    """
+    return bot_class._router.route(bot_class.DEFAULT_STATE, tags) in bot_class.CRISIS_STATES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rate', type=float, default=5, help='new users per second')
+    parser.add_argument('--users', type=int, default=1000, help='most users at once')
+    parser.add_argument('--think', type=float, default=2, help='mean seconds between replies and answers')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run for')
+    parser.add_argument('--report', type=float, default=10, help='seconds between reports')
+    parser.add_argument('--poll', type=float, default=0.01, help="chatbot's POLL_INTERVAL")
+    parser.add_argument('--timeout', type=float, default=3600, help="chatbot's CONVERSATION_TIMEOUT")
+    parser.add_argument('--confusion', type=float, default=0.1, help='share of untagged messages')
+    parser.add_argument('--post-delay', type=float, default=0, help='seconds each posted reply takes')
+    parser.add_argument('--patience', type=float, default=30, help='seconds before resending an unanswered message')
+    parser.add_argument('--high', type=int, default=500, help="chatbot's INTAKE_HIGH")
+    parser.add_argument('--low', type=int, default=None, help="chatbot's INTAKE_LOW")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['POLL_INTERVAL'] = str(args.poll)
+    os.environ['CONVERSATION_TIMEOUT'] = str(args.timeout)
+    rng = random.Random(args.seed)
+    writer = ScriptWriter(OxyCSBot, rng, args.confusion)
+    slack = FakeSlack(args.post_delay)
+    bots = {}
+    tagger = OxyCSBot()._get_tags
+    intake = Intake(args.high, args.low, tagger, OxyCSBot.CRISIS_TAGS)
+    threading.Thread(
+        target=slackbot.run, args=(OxyCSBot, slack.connect, bots, intake), daemon=True,
+    ).start()
+
+    report = sys.stderr
+    print(' '.join([
+        f'{"time":>6} {"users":>6} {"replies/s":>9}',
+        f'{"p50 ms":>8} {"p99 ms":>8} {"p999 ms":>8}',
+        f'{"RSS MB":>7} {"held":>6} {"stale":>6} {"leaked":>6}',
+        f'{"queued":>6} {"shed":>6} {"crisis":>6}',
+    ]), file=report)
+
+    start = perf_counter()
+    end = start + args.duration
+    next_report = start + args.report
+    next_arrival = start + rng.expovariate(args.rate)
+    waiting = {}    # channel -> user waiting for a reply
+    thinking = []   # heap of (time to send, number, user)
+    arrived = 0
+    crises_shed = 0
+    interval = LatencyHistogram()
+    overall = LatencyHistogram()
+    interval_start = start
+
+    def send(user, now):
+        if user.retry:
+            message = user.message
+            user.retry = False
+        else:
+            message = user.message = next(user.script, None)
+        if message is None:
+            return
+        user.sent_at = now
+        waiting[user.channel] = user
+        slack.send(user.channel, user.name, message)
+
+    while True:
+        now = perf_counter()
+        if now >= end:
+            break
+
+        while next_arrival <= now:
+            if len(waiting) + len(thinking) < args.users:
+                arrived += 1
+                send(User(arrived, writer.script()), now)
+            next_arrival += rng.expovariate(args.rate)
+
+        while slack.replies:
+            channel, replied_at, busy = slack.replies.popleft()
+            user = waiting.pop(channel, None)
+            if user is None:
+                continue
+            if busy:
+                user.retry = True
+                bot = bots.get((channel, user.name))
+                if (bot is not None and bot.state in OxyCSBot.CRISIS_STATES
+                        or routes_to_crisis(OxyCSBot, tagger(user.message))):
+                    crises_shed += 1
+            else:
+                latency = replied_at - user.sent_at
+                interval.add(latency)
+                overall.add(latency)
+            heapq.heappush(thinking, (replied_at + rng.expovariate(1 / args.think), id(user), user))
+
+        while thinking and thinking[0][0] <= now:
+            _, _, user = heapq.heappop(thinking)
+            send(user, now)
+
+        if now >= next_report:
+            # A chatbot that is shedding only says it is busy once, so users
+            # whose later messages were shed silently send them again
+            for channel, user in list(waiting.items()):
+                if now - user.sent_at > args.patience:
+                    del waiting[channel]
+                    user.retry = True
+                    send(user, now)
+            active = set(waiting) | {user.channel for _, _, user in thinking}
+            stale, leaked = conversation_leaks(bots, active, 'waiting')
+            print(' '.join([
+                f'{now - start:6.0f} {len(active):6d}',
+                f'{interval.total / (now - interval_start):9.1f}',
+                f'{interval.percentile(0.5) * 1000:8.2f}',
+                f'{interval.percentile(0.99) * 1000:8.2f}',
+                f'{interval.percentile(0.999) * 1000:8.2f}',
+                f'{resident_memory() / 2 ** 20:7.1f}',
+                f'{len(bots):6d} {stale:6d} {leaked:6d}',
+                f'{intake.depth():6d} {intake.shed:6d} {crises_shed:6d}',
+            ]), file=report, flush=True)
+            interval = LatencyHistogram()
+            interval_start = now
+            next_report += args.report
+
+        sleep(0.001)
+
+    elapsed = perf_counter() - start
+    print(' '.join([
+        f'total: {arrived} users, {overall.total} replies,',
+        f'{overall.total / elapsed:.1f} replies/s,',
+        f'p50 {overall.percentile(0.5) * 1000:.2f} ms,',
+        f'p99 {overall.percentile(0.99) * 1000:.2f} ms,',
+        f'p999 {overall.percentile(0.999) * 1000:.2f} ms',
+    ]), file=report)
+    print(f'{intake.stats()}, {crises_shed} crises shed', file=report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Fast detection of the language of a message.
+
+Chinese is told apart by its script. Languages written in the Latin script
+are told apart by their most common short words, which are looked up in a
+single table however many languages there are, so detection costs one
+dictionary lookup per token. English is the default: a message is only given
+another locale if it has more of that locale's words than English ones, but
+`detect_all` also lists the other locales whose words it has.
+"""
+
+from normalize import HAN, pattern
+
+HAN_CHARACTER = f'[{HAN}]'
+
+# Common words that are (almost) never used in the other languages; accents
+# are removed by normalization, so "qué" is listed as "que"
+FUNCTION_WORDS = {
+    'en': [
+        'i', 'im', 'am', 'the', 'and', 'my', 'is', 'to', 'so', 'it',
+        'feel', 'really', 'just', 'with', 'about', 'have', 'what', 'you',
+        'this', 'of', 'in', 'for', 'but', 'very', 'not', 'was',
+    ],
+    'es': [
+        'estoy', 'soy', 'muy', 'que', 'el', 'la', 'los', 'las', 'y', 'mi',
+        'mis', 'de', 'del', 'en', 'con', 'por', 'para', 'pero', 'porque',
+        'tengo', 'siento', 'hola', 'gracias', 'nada', 'mucho', 'todo',
+        'como', 'estas', 'tambien', 'nadie', 'quiero', 'puedo', 'bien', 'si',
+        'hoy', 'una', 'un', 'es', 'esta', 'se', 'lo', 'le', 'voy', 'ganas',
+        '¿', '¡',
+    ],
+}
+WORD_LOCALES = {
+    word: locale for locale, words in FUNCTION_WORDS.items() for word in words
+}
+# Most messages are in English, and can be told apart from the rest by these
+OTHER_WORDS = frozenset(
+    word for word, locale in WORD_LOCALES.items() if locale != 'en'
+)
+
+
+def detect(message):
+    """Guess the locale of a normalized message.
+
+    Arguments:
+        message (normalize.Message): The message.
+
+    Returns:
+        str: 'zh' for messages with Chinese characters, otherwise the locale
+            with the most common words in the message, or None for English
+            and messages that could be anything.
+    """
+    return detect_all(message)[0]
+
+
+def detect_all(message):
+    """Find every locale a normalized message has words of.
+
+    Messages often mix languages ("i'm so sad, quiero morir"), and the words
+    that matter most can be in the language with fewer words.
+
+    Arguments:
+        message (normalize.Message): The message.
+
+    Returns:
+        List[Optional[str]]: The locale of the message (see `detect`), then
+            every other locale, except English, with common words in it.
+    """
+    if message.ascii and OTHER_WORDS.isdisjoint(message.tokens):
+        return [None]
+    han = not message.ascii and pattern(HAN_CHARACTER).search(message.text)
+    counts = {}
+    for token in message.tokens:
+        locale = WORD_LOCALES.get(token)
+        if locale is not None:
+            counts[locale] = counts.get(locale, 0) + 1
+    if han:
+        best = 'zh'
+    elif not counts:
+        return [None]
+    else:
+        best = max(counts, key=counts.get)
+        if best == 'en' or counts[best] <= counts.get('en', 0):
+            best = None
+    return [best] + [locale for locale in counts if locale != 'en' and locale != best]
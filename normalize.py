@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""One canonical form of each incoming message, shared by every stage."""
+
+import re
+import unicodedata
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Chinese is written without spaces between words, so every Han character is
+# a token of its own; lexicons with Chinese phrases join them back into words
+# (see `lexicon.segment`)
+HAN = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+HAN_TOKEN = f'[{HAN}]|[^\\W{HAN}]+|[^\\w\\s]'
+NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+# str.isascii is new in Python 3.7, and ten times faster than the search
+if hasattr(str, 'isascii'):
+    _is_ascii = str.isascii
+else:
+    def _is_ascii(text):
+        """Check whether text only has ASCII characters."""
+        return NON_ASCII.search(text) is None
+
+ACCENTS = re.compile('[\u0300-\u036f]')
+QUOTES = str.maketrans('\u2018\u2019', "''")
+
+# Slack escapes &, < and > and wraps mentions, channels and links in <...>;
+# emoji are :shortcodes:
+MARKUP = re.compile(r'<([^<>|]*)(?:\|([^<>]*))?>|:[a-z0-9_+\-]+:|&(amp|lt|gt);')
+ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>'}
+
+
+_patterns = {}
+
+
+def pattern(source):
+    """Compile a regular expression the first time it is needed.
+
+    Patterns with large character classes, like HAN_TOKEN, take milliseconds
+    to compile, which workers that never see such text should not pay at
+    startup.
+
+    Arguments:
+        source (str): The regular expression.
+
+    Returns:
+        Pattern: The compiled expression.
+    """
+    compiled = _patterns.get(source)
+    if compiled is None:
+        compiled = _patterns[source] = re.compile(source)
+    return compiled
+
+
+def _unmark(match):
+    """Replace one piece of Slack markup with its plain text."""
+    target, label, entity = match.groups()
+    if entity is not None:
+        return ENTITIES[entity]
+    if label is not None:
+        return label
+    if target is not None and not target.startswith(('@', '#', '!')):
+        return target
+    return ' '
+
+
+def _fold(text):
+    """Fold the non-ASCII characters of text into the forms phrases use.
+
+    Compatibility forms (eg. full-width letters) are replaced by plain ones,
+    accents are removed, so "estrés" and "estres" match, and curly quotes
+    are straightened.
+    """
+    text = ACCENTS.sub('', unicodedata.normalize('NFKD', text))
+    return text.translate(QUOTES)
+
+
+def clean(text):
+    """Strip Slack markup from text and casefold it.
+
+    Mentions, channel links and emoji are removed, links are replaced by their
+    label (or address), and escaped characters are unescaped. Accents are
+    removed from non-ASCII text (see `_fold`).
+
+    Arguments:
+        text (str): The text of a Slack message.
+
+    Returns:
+        str: The plain, casefolded text.
+    """
+    if '<' in text or ':' in text or '&' in text:
+        text = MARKUP.sub(_unmark, text)
+    if not _is_ascii(text):
+        text = _fold(text)
+    return text.casefold()
+
+
+class Message:
+    """A normalized message: casefolded, without markup, and tokenized.
+
+    Each message is normalized once, when it arrives, and the same object is
+    then used for tagging, the tag cache and the fallback classifier. Token
+    offsets are only worked out if something asks for them.
+
+    Most messages are plain ASCII, so the text is only searched for other
+    characters once; ASCII messages skip folding and are split with the
+    simple TOKEN pattern, and `ascii` tells later stages (eg. locale
+    detection) that they cannot hold Chinese.
+    """
+
+    __slots__ = ('raw', 'text', 'tokens', 'ascii', '_offsets')
+
+    def __init__(self, raw):
+        """Normalize a message.
+
+        Arguments:
+            raw (str): The message as it was received.
+        """
+        self.raw = raw
+        text = raw
+        if '<' in text or ':' in text or '&' in text:
+            text = MARKUP.sub(_unmark, text)
+        self.ascii = _is_ascii(text)
+        if self.ascii:
+            self.text = text = text.lower()
+            self.tokens = TOKEN.findall(text)
+        else:
+            self.text = text = _fold(text).casefold()
+            self.tokens = pattern(HAN_TOKEN).findall(text)
+        self._offsets = None
+
+    @property
+    def offsets(self):
+        """List[int]: Where each token starts in `text`."""
+        if self._offsets is None:
+            offsets = []
+            position = 0
+            for token in self.tokens:
+                position = self.text.index(token, position)
+                offsets.append(position)
+                position += len(token)
+            self._offsets = offsets
+        return self._offsets
+
+    def __str__(self):
+        return self.raw
+
+    def __repr__(self):
+        return f'Message({self.raw!r})'
+
+
+def normalize(message):
+    """Normalize a message, unless it already has been.
+
+    Arguments:
+        message (Union[str, Message]): The message.
+
+    Returns:
+        Message: The normalized message.
+    """
+    if isinstance(message, Message):
+        return message
+    return Message(message)
+
+
+def tokenize(text):
+    """Split text into casefolded words and punctuation.
+
+    Arguments:
+        text (str): The text to split.
+
+    Returns:
+        List[str]: The tokens of the text.
+    """
+    return _split(clean(text))
+
+
+def _split(text):
+    """Split clean text into tokens."""
+    if not _is_ascii(text):
+        return pattern(HAN_TOKEN).findall(text)
+    return TOKEN.findall(text)
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 """A tag-based chatbot framework."""
 
-import re
-from collections import Counter
-
+import sys
 import time
+from os import path
+
+from experiments import Experiment
+from lexicon import LocalizedLexicon
+from normalize import Message, normalize
+from routing import Router
+from stategraph import PREVIOUS, compile_graph, goes_to, responds_like
 
 class ChatBot:
     """A tag-based chatbot framework
@@ -17,7 +22,7 @@ class ChatBot:
     * A set of TAGS that match on words in the message.
 
     Subclasses must implement two methods for every state (except the
-    default): the `on_enter_*` method and the `respond_from_*` method. For
+    DEFAULT_STATE): the `on_enter_*` method and the `respond_from_*` method. For
     example, if there is a state called "confirm_delete", there should be two
     methods `on_enter_confirm_delete` and `respond_from_confirm_delete`.
 
@@ -32,7 +37,8 @@ class ChatBot:
         It takes two arguments: a string `message`, and a dictionary `tags`
         which counts the number of times each tag appears in the message. This
         function should always return with calls to either `go_to_state` or
-        `finish`.
+        `finish`, and must declare which states and `finish_*` methods it can
+        go to with the `@goes_to` (or `@responds_like`) decorator.
 
     The `go_to_state` method automatically calls the related `on_enter_*`
     method before setting the state of the chatbot. The `finish` function calls
@@ -42,60 +48,160 @@ class ChatBot:
     The TAGS class variable is a dictionary whose keys are words/phrases and
     whose values are (list of) tags for that word/phrase. If the words/phrases
     match a message, these tags are provided to the `respond_from_*` methods.
+    The optional PHRASE_WEIGHTS class variable gives some words/phrases more
+    (or less) weight than the default of 1. TAGS are in English; the LOCALES
+    class variable names a lexicon file with the TAGS of each other language
+    (see `lexicon.LocalizedLexicon`), which is used for messages in it.
+
+    Instead of a `respond_from_*` method, a state can be given a list of
+    weighted rules in the ROUTES class variable (see `routing.Router`). The
+    tags of the message are then scored against those rules, and the best
+    scoring target is entered; if no rule matches, FALLBACK_ROUTE is.
+
+    If `transition_log` is set to a `transitions.TransitionLog`, every
+    `go_to_state` and `finish` is written to it, along with the chatbot's
+    `conversation` id, the tags of the message and the time spent responding.
+
+    If `fallback` is set to a `fallback.FallbackClassifier`, messages that
+    match no TAGS are given the tag it guesses instead.
+
+    When the chatbot is too busy to answer everyone (see `intake.Intake`),
+    messages are turned away with BUSY_RESPONSE, except for messages with any
+    of the CRISIS_TAGS, which are always answered. Every tag that ROUTES to
+    one of the CRISIS_STATES is added to CRISIS_TAGS when the class is
+    created, so a new way into a crisis state is never shed.
+
+    When a state is renamed, add its old name to RENAMED_STATES, so that
+    conversations saved in it by an older worker (see `snapshot`) resume in
+    the new state.
+
+    The EXPERIMENTS class variable lists `experiments.Experiment`s, which
+    try other wordings of `on_enter_*` methods, and count
+    how the conversations that saw each wording finished.
+
+    When a subclass is created, its STATES are compiled into a transition
+    graph (see `stategraph.compile_graph`), which must reach every state and
+    always be able to finish, and its TAGS and ROUTES into a lexicon and
+    router. Slower checks of the source are left to `check` (run it with
+    `python3 oxycsbot.py --check` before deploying).
     """
 
     STATES = []
+    DEFAULT_STATE = None
     TAGS = {}
-
-    def __init__(self, default_state):
+    PHRASE_WEIGHTS = {}
+    LOCALES = {}
+    ROUTES = {}
+    FALLBACK_ROUTE = None
+    RENAMED_STATES = {}
+    CRISIS_TAGS = ()
+    CRISIS_STATES = ()
+    BUSY_RESPONSE = "I'm talking with a lot of people right now. Please try again in a minute."
+    EXPERIMENTS = []
+
+    transition_log = None
+    fallback = None
+
+    def __init_subclass__(cls, **kwargs):
+        """Compile the states, lexicon and routes of a chatbot class."""
+        super().__init_subclass__(**kwargs)
+        if not cls.STATES:
+            return
+        cls._lexicon = LocalizedLexicon(cls.TAGS, cls.PHRASE_WEIGHTS, cls.LOCALES)
+        cls._router = Router(cls.ROUTES, cls.FALLBACK_ROUTE)
+        routed = {
+            rule[0] for rules in cls.ROUTES.values() for rule in rules
+            if rule[1] in cls.CRISIS_STATES
+        }
+        cls.CRISIS_TAGS = list(cls.CRISIS_TAGS) + sorted(routed.difference(cls.CRISIS_TAGS))
+        if 'EXPERIMENTS' in cls.__dict__:
+            for experiment in cls.EXPERIMENTS:
+                experiment.bind(cls)
+        cls._graph, cls._dispatch, cls._on_enter = compile_graph(cls)
+
+    def __init__(self, conversation=None):
         """Initialize a Chatbot.
 
         Arguments:
-            default_state (str): The starting state of the agent.
+            conversation (Hashable): The id of the conversation this chatbot
+                is having, eg. a Slack channel and user. Optional.
         """
-        if default_state not in self.STATES:
-            print(' '.join([
-                f'WARNING:',
-                f'The default state {default_state} is listed as a state.',
-                f'Perhaps you mean {self.STATES[0]}?',
-            ]))
-        self.default_state = default_state
+        self.default_state = self.DEFAULT_STATE
+        self.conversation = conversation
         self.state = self.default_state
         self.prev_state = ""
         self.finish_flag = False  # Keeps track if the conversation has reached an "end"
         self.greeted_flag = False   # Keeps track if user has already been greeted
         self.try_count = 0 # Keeps track of how many times bot is confused in a row
         self.tags = {}
-        self._check_states()
-        self._check_tags()
-
-    def _check_states(self):
-        """Check the STATES to make sure that relevant functions are defined."""
-        for state in self.STATES:
-            prefixes = []
-            if state != self.default_state:
-                prefixes.append('on_enter')
-            prefixes.append('respond_from')
-            for prefix in prefixes:
-                if not hasattr(self, f'{prefix}_{state}'):
-                    print(' '.join([
-                        f'WARNING:',
-                        f'State "{state}" is defined',
-                        f'but has no response function self.{prefix}_{state}',
-                    ]))
+        self.turn_start = 0.0
+        self.exposures = None # The variant of each experiment seen since the last finish
+
+    def check(self):
+        """Check the source, TAGS and ROUTES for mistakes.
+
+        The state graph itself is already checked when the class is created;
+        this also reads the source of the `respond_from_*` methods, which is
+        too slow to do on every start.
+
+        Returns:
+            bool: True if no mistakes were found. Each mistake is printed.
+        """
+        from stategraph import analyze
+        problems = analyze(self.__class__)
+        problems.extend(self._check_tags())
+        problems.extend(self._check_routes())
+        problems.extend(self._check_locales())
+        for problem in problems:
+            print(problem)
+        return not problems
 
     def _check_tags(self):
         """Check the TAGS to make sure that it has the correct format."""
-        for phrase in self.TAGS:
-            tags = self.TAGS[phrase]
-            if isinstance(tags, str):
-                self.TAGS[phrase] = [tags]
-            tags = self.TAGS[phrase]
-            assert isinstance(tags, (tuple, list)), ' '.join([
-                'ERROR:',
-                'Expected tags for {phrase} to be str or List[str]',
-                f'but got {tags.__class__.__name__}',
-            ])
+        problems = []
+        for phrase, tags in self.TAGS.items():
+            if not isinstance(tags, (str, tuple, list)):
+                problems.append(' '.join([
+                    'ERROR:',
+                    f'Expected tags for {phrase} to be str or List[str]',
+                    f'but got {tags.__class__.__name__}',
+                ]))
+        return problems
+
+    def _check_routes(self):
+        """Check the ROUTES to make sure their states and tags exist."""
+        problems = []
+        known_tags = set()
+        for tags in self.TAGS.values():
+            known_tags.update([tags] if isinstance(tags, str) else tags)
+        for state, rules in self.ROUTES.items():
+            if state not in self.STATES:
+                problems.append(f'WARNING: ROUTES has rules for unknown state "{state}"')
+            for rule in rules:
+                if rule[0] not in known_tags:
+                    problems.append(f'WARNING: ROUTES["{state}"] uses unknown tag "{rule[0]}"')
+        return problems
+
+    def _check_locales(self):
+        """Check that the lexicon of each locale only uses tags from TAGS."""
+        problems = []
+        known_tags = set()
+        for tags in self.TAGS.values():
+            known_tags.update([tags] if isinstance(tags, str) else tags)
+        for locale in self.LOCALES:
+            try:
+                tags, weights, _ = self._lexicon.load(locale)
+            except (OSError, ValueError, KeyError) as error:
+                problems.append(f'ERROR: cannot read the {locale} lexicon: {error!r}')
+                continue
+            for phrase, phrase_tags in tags.items():
+                for tag in [phrase_tags] if isinstance(phrase_tags, str) else phrase_tags:
+                    if tag not in known_tags:
+                        problems.append(f'WARNING: {locale} phrase "{phrase}" has unknown tag "{tag}"')
+            for phrase in weights:
+                if phrase not in tags:
+                    problems.append(f'WARNING: {locale} weighs "{phrase}", which has no tags')
+        return problems
 
     def go_to_state(self, state):
         """Set the chatbot's state after responding appropriately.
@@ -112,8 +218,8 @@ class ChatBot:
             f"do not call `go_to_state` on the default state {self.default_state};",
             f'use `finish` instead',
         ])
-        on_enter_method = getattr(self, f'on_enter_{state}')
-        response = on_enter_method()
+        response = self._on_enter[state](self)
+        self._log_transition(state)
 
 
         if not (state is "confused" and self.state is "confused"): # if both the next and current state are confused, don't change prev_state (because we want to return to the state prior to confuse (to continue the conversation)
@@ -138,20 +244,64 @@ class ChatBot:
             print()
             exit()
 
-    def respond(self, message):
+    def respond(self, message, tags=None):
         """Respond to a message.
 
+        The message is normalized once (see `normalize.Message`), and that
+        form is shared by the lexicon, its cache and the fallback classifier.
+        When the tags are given, it is only normalized if the fallback
+        classifier needs it.
+
         Arguments:
-            message (str): The message from the user.
+            message (Union[str, normalize.Message]): The message from the user.
+            tags (Dict[str, int]): The tags of the message, if they have
+                already been counted (eg. by a `TurnAggregator`). Optional.
 
         Returns:
             str: The response of the chatbot.
         """
-        respond_method = getattr(self, f'respond_from_{self.state}')
         #print(self._get_tags(message))
         if self.state is not "confused":
             self.try_count = 0
-        return respond_method(message, self._get_tags(message))
+        if tags is None:
+            message = normalize(message)
+            tags = self._lexicon.match(message)
+        if not tags and self.fallback is not None:
+            message = normalize(message)
+            tags = self.fallback.classify(message)
+        if isinstance(message, Message):
+            message = message.raw
+        self.tags = tags
+        self.turn_start = time.perf_counter()
+        return self._respond_from(self.state, message, tags)
+
+    def _respond_from(self, state, message, tags):
+        """Respond to a message as if the chatbot were in a given state.
+
+        Arguments:
+            state (str): The state to respond from.
+            message (str): The message from the user.
+            tags (Dict[str, float]): The tags of the message.
+
+        Returns:
+            str: The response of the chatbot.
+        """
+        return self._dispatch[state](self, message, tags)
+
+    def route(self, state, tags):
+        """Go to the best scoring target of a state's ROUTES.
+
+        Arguments:
+            state (str): The state whose routes to use.
+            tags (Dict[str, float]): The tags of the message.
+
+        Returns:
+            str: The response of the chatbot.
+        """
+        target = self._router.route(state, tags, self)
+        if target.startswith('finish_'):
+            return self.finish(target[len('finish_'):])
+        return self.go_to_state(target)
 
     def finish(self, manner):
         """Set the chatbot back to the default state
@@ -166,6 +316,11 @@ class ChatBot:
         """
         self.finish_flag = True
         response = getattr(self, f'finish_{manner}')()
+        self._log_transition(f'finish_{manner}')
+        if self.exposures:
+            for experiment, variant in self.exposures.items():
+                experiment.record(variant, manner)
+            self.exposures = None
         #print(self.state)
         if manner is "success" or manner is "fail" or manner is "thanks" or manner is "cant_help": # if it truly is the end of the conversation, add the tag so that users don't try to continue the conbo
             self.state = self.default_state
@@ -182,21 +337,33 @@ class ChatBot:
 
 
 
+    def _log_transition(self, target):
+        """Write a transition from the current state to the transition log.
+
+        Arguments:
+            target (str): The state being entered, or `finish_<manner>`.
+        """
+        if self.transition_log is None:
+            return
+        self.transition_log.write(
+            self.conversation,
+            self.state,
+            target,
+            self.tags,
+            time.perf_counter() - self.turn_start,
+        )
+
     def _get_tags(self, message):
         """Find all tagged words/phrases in a message.
 
         Arguments:
-            message (str): The message from the user.
+            message (Union[str, normalize.Message]): The message from the user.
 
         Returns:
-            Dict[str, int]: A count of each tag found in the message.
+            Dict[str, float]: A count of each tag found in the message,
+                weighted by PHRASE_WEIGHTS. Do not modify it; it may be cached.
         """
-        counter = Counter()
-        msg = message.lower()
-        for phrase, tags in self.TAGS.items():
-            if re.search(r'\b' + phrase.lower() + r'\b', msg):
-                counter.update(tags)
-        return counter
+        return self._lexicon.match(message)
 
 
 class OxyCSBot(ChatBot):
@@ -204,9 +371,6 @@ class OxyCSBot(ChatBot):
 
     STATES = [
         'waiting',
-        'specific_faculty',
-        'unknown_faculty',
-        'unrecognized_faculty',
         'why_sad',
         'talk_to_professors',
         'other_factors',
@@ -234,7 +398,7 @@ class OxyCSBot(ChatBot):
         'hate': 'sad',
         'depressed': "sad",
         "depression": "depression",
-        'disappointed': "sad",
+        'disappointed': ["sad", "failing academics"],
         'miss': "sad",
         'hopeless': "sad",
         'disinterested': "sad",
@@ -253,7 +417,7 @@ class OxyCSBot(ChatBot):
         "restless": "anxious",
         "overwhelmed": "anxious",
         "agitated": "anxious",
-        "life": "anxious",
+        "life": ["anxious", "suicidal"],
         "uneasy": "anxious",
         "troubled": "anxious",
 
@@ -263,14 +427,13 @@ class OxyCSBot(ChatBot):
         "exams": "failing academics",
         "gpa": "failing academics",
         "classes": "failing academics",
-        "disappointed": "failing academics",
         "work": "failing academics",
         "assignment": "failing academics",
         "grades": "failing academics",
         "frustrated": "failing academics",
         "annoyed": "failing academics",
         "efforts": "failing academics",
-        "failing": "failing academics",
+        "failing": ["failing academics", "difficult courses"],
         "quit school": "failing academics",
 
         # social isolation
@@ -290,7 +453,6 @@ class OxyCSBot(ChatBot):
         "die": "suicidal",
         "kill myself": "suicidal",
         "killed": "suicidal",
-        "life": "suicidal",
         "death": "suicidal",
         "end": "suicidal",
         "commit": "suicidal",
@@ -321,7 +483,6 @@ class OxyCSBot(ChatBot):
         "I'm behind": "difficult courses",
         "trouble": "difficult courses",
         "helpless": "difficult courses",
-        "failing": "difficult courses",
 
         # overload
         "too much": "courses overload",
@@ -350,16 +511,6 @@ class OxyCSBot(ChatBot):
         "occured": "specific events",
         "recently": "specific events",
 
-        # professors
-        'kathryn': 'kathryn',
-        'leonard': 'kathryn',
-        'justin': 'justin',
-        'li': 'justin',
-        'jeff': 'jeff',
-        'miller': 'jeff',
-        'celia': 'celia',
-        'hsing-hau': 'hsing-hau',
-
         # generic
         'thanks': 'thanks',
         'thank you': 'thanks',
@@ -394,68 +545,192 @@ class OxyCSBot(ChatBot):
 
     }
 
-    PROFESSORS = [
-        'celia',
-        'hsing-hau',
-        'jeff',
-        'justin',
-        'kathryn',
-    ]
-
-    def __init__(self):
-        """Initialize the OxyCSBot.
+    # the TAGS of other languages, read the first time a message in one is seen
+    LOCALES = {
+        locale: path.join(path.dirname(path.abspath(__file__)), 'lexicons', f'{locale}.json')
+        for locale in ('es', 'zh')
+    }
 
-        The `professor` member variable stores whether the target
-        professor has been identified.
-        """
+    # words/phrases that are stronger (or weaker) signs of their tags than usual
+    PHRASE_WEIGHTS = {
+        'kill myself': 3,
+        'suicidal': 3,
+        'suicide': 3,
+        'life is meaningless': 2,
+        'no point in': 2,
+        'not good': 2,
+        'no friends': 2,
+        'not cared for': 2,
+        "don't feel well": 2,
+        "don't want to": 2,
+        'no thanks': 2,
+        'not really': 2,
+        'not sure': 2,
+        "don't know": 2,
+        'life': 0.5,
+        'end': 0.5,
+        'commit': 0.5,
+        'then': 0.5,
+        'work': 0.5,
+        'well': 0.5,
+        'not': 0.5,
+    }
 
+    # (tag, target, weight[, flag]) rules for the states that simply route on
+    # tags; see `routing.Router`
+    ROUTES = {
+        'waiting': [
+            ('suicidal', 'suicidal_response_friends', 10),
+            ('suicide', 'suicidal_response_friends', 10),
+            ('sad', 'why_sad', 8),
+            ('depression', 'why_sad', 8),
+            ('good', 'finish_good_response', 7),
+            ('social isolation', 'clubs', 6),
+            ('isolated', 'clubs', 6),
+            ('anxious', 'anxious_breathe', 6),
+            ('thanks', 'finish_thanks', 5, 'finish_flag'),
+            ('idk', 'why_sad', 4),
+            ('health issues', 'finish_health_resources', 4),
+            ('difficult courses', 'finish_academic_resources', 4),
+            ('courses overload', 'finish_course_overload_response', 4),
+            ('specific events', 'specific_event_response', 3),
+            ('failing academics', 'talk_to_professors', 3),
+            ('help', 'greeting', 2),
+            ('hi', 'greeting', 2),
+            ('success', 'finish_success', 1.5, 'finish_flag'),
+            ('success', 'finish_greeted_good_response', 1, 'greeted_flag'),
+            ('no', 'finish_cant_help', 1, 'finish_flag'),
+        ],
+        'anxious_breathe': [
+            ('yes', 'finish_success', 2),
+            ('no', 'why_not', 1),
+            ('idk', 'why_not', 1),
+        ],
+        'suicidal_response_friends': [
+            ('idk', 'finish_hotline_idk', 3),
+            ('no', 'finish_hotline', 2),
+            ('yes', 'finish_talk_to_friends', 1),
+        ],
+        'why_sad': [
+            ('suicidal', 'suicidal_response_friends', 10),
+            ('suicide', 'suicidal_response_friends', 10),
+            ('sad', 'why_sad', 8),
+            ('depression', 'why_sad', 8),
+            ('good', 'finish_good_response', 7),
+            ('anxious', 'anxious_breathe', 6),
+            ('social isolation', 'clubs', 6),
+            ('isolated', 'clubs', 6),
+            ('thanks', 'finish_thanks', 5, 'finish_flag'),
+            ('failing academics', 'talk_to_professors', 5),
+            ('idk', 'figure_out_feelings', 4),
+            ('health issues', 'finish_health_resources', 4),
+            ('difficult courses', 'finish_academic_resources', 4),
+            ('courses overload', 'finish_course_overload_response', 4),
+            ('specific events', 'specific_event_response', 3),
+            ('help', 'greeting', 2),
+            ('hi', 'greeting', 2),
+            ('no', 'finish_cant_help', 1, 'finish_flag'),
+        ],
+        'figure_out_feelings': [
+            ('suicidal', 'suicidal_response_friends', 10),
+            ('suicide', 'suicidal_response_friends', 10),
+            ('sad', 'why_sad', 8),
+            ('depression', 'why_sad', 8),
+            ('anxious', 'anxious_breathe', 6),
+            ('social isolation', 'clubs', 6),
+            ('isolated', 'clubs', 6),
+            ('yes', 'why_sad', 5),
+            ('no', 'why_sad', 5),
+            ('idk', 'why_sad', 4),
+            ('health issues', 'finish_health_resources', 4),
+            ('failing academics', 'talk_to_professors', 4),
+            ('difficult courses', 'finish_academic_resources', 4),
+            ('courses overload', 'finish_course_overload_response', 4),
+            ('help', 'greeting', 2),
+            ('hi', 'greeting', 2),
+        ],
+        'clubs': [
+            ('no', 'why_not', 3),
+            ('yes', 'finish_join_clubs', 2),
+            ('idk', 'finish_should_join_club', 1),
+        ],
+        'why_not': [
+            ('suicidal', 'suicidal_response_friends', 10),
+            ('suicide', 'suicidal_response_friends', 10),
+            ('sad', 'why_sad', 8),
+            ('depression', 'why_sad', 8),
+            ('good', 'finish_good_response', 7),
+            ('anxious', 'anxious_breathe', 6),
+            ('thanks', 'finish_thanks', 5, 'finish_flag'),
+            ('idk', 'figure_out_feelings', 4),
+            ('health issues', 'finish_health_resources', 4),
+            ('difficult courses', 'finish_academic_resources', 4),
+            ('failing academics', 'talk_to_professors', 4),
+            ('social isolation', 'clubs', 4),
+            ('isolated', 'clubs', 4),
+            ('courses overload', 'finish_course_overload_response', 4),
+            ('specific events', 'specific_event_response', 3),
+            ('help', 'greeting', 2),
+            ('hi', 'greeting', 2),
+            ('no', 'finish_cant_help', 1, 'finish_flag'),
+        ],
+        'talk_to_professors': [
+            ('no', 'finish_talk_to_them', 2),
+            ('yes', 'other_factors', 1),
+        ],
+        'other_factors': [
+            ('suicidal', 'suicidal_response_friends', 10),
+            ('suicide', 'suicidal_response_friends', 10),
+            ('sad', 'why_sad', 8),
+            ('depression', 'why_sad', 8),
+            ('good', 'finish_good_response', 7),
+            ('anxious', 'anxious_breathe', 6),
+            ('thanks', 'finish_thanks', 5, 'finish_flag'),
+            ('idk', 'figure_out_feelings', 4),
+            ('social isolation', 'clubs', 4),
+            ('isolated', 'clubs', 4),
+            ('health issues', 'finish_health_resources', 4),
+            ('difficult courses', 'finish_academic_resources', 4),
+            ('courses overload', 'finish_course_overload_response', 4),
+            ('specific events', 'specific_event_response', 3),
+            ('help', 'greeting', 2),
+            ('hi', 'greeting', 2),
+            ('no', 'finish_cant_help', 1, 'finish_flag'),
+        ],
+    }
 
-        super().__init__(default_state='waiting')
+    FALLBACK_ROUTE = 'confused'
+
+    DEFAULT_STATE = 'waiting'
+
+    CRISIS_TAGS = ['suicidal', 'suicide']
+
+    CRISIS_STATES = ['suicidal_response_friends']
+
+    BUSY_RESPONSE = '\n'.join([
+        "I'm talking with a lot of people right now. Please try again in a minute.",
+        "If you are thinking about hurting yourself, tell me right away, or call or text 988.",
+    ])
+
+    EXPERIMENTS = [
+        Experiment('breathe_count', 'on_enter_anxious_breathe', {
+            'count_breaths': '\n'.join([
+                "It sounds like a lot is happening at once.",
+                "Let's slow down together: breathe in for 4 seconds, hold for 4, and breathe out for 4.",
+                "Try that 3 times. Do you feel a little better?",
+            ]),
+        }),
+        Experiment('crisis_988', 'on_enter_suicidal_response_friends', {
+            'offer_988': '\n'.join([
+                "I'm sorry... you must be going through a lot.",
+                "You don't have to go through it alone. You can call or text 988 any time, day or night.",
+                "Do you have any friends, family, or anyone you can talk to right now?",
+            ]),
+        }),
+    ]
 
     def respond_using(self, state, message):
-        respond_method = getattr(self, f'respond_from_{state}')
-        return respond_method(message, self._get_tags(message))
-
-    # "waiting" state functions
-
-    def respond_from_waiting(self, message, tags):
-        if "sad" in tags:
-            return self.go_to_state('why_sad')
-        elif "good" in tags:
-            return self.finish("good_response")
-        elif "social isolation" in tags:
-            return self.go_to_state("clubs")
-        elif "suicidal" in tags:
-            return self.go_to_state('suicidal_response_friends')
-        elif "anxious" in tags:
-            return self.go_to_state('anxious_breathe')
-        elif "thanks" in tags and self.finish_flag:
-            return self.finish("thanks")
-        elif "thanks" in tags and not self.finish_flag:
-            return self.go_to_state("confused")
-        elif "idk" in tags:
-            return self.go_to_state("why_sad")
-        elif 'health issues' in tags:
-            return self.finish('health_resources')
-        elif "difficult courses" in tags:
-            return self.finish('academic_resources')
-        elif "courses overload" in tags:
-            return self.finish('course_overload_response')
-        elif "specific events" in tags:
-            return self.go_to_state("specific_event_response")
-        elif 'failing academics' in tags:
-            return self.go_to_state("talk_to_professors")
-        elif "help" in tags or "hi" in tags:
-            return self.go_to_state('greeting')
-        elif "success" in tags and self.finish_flag: # show success if user says ok at the end of conversation
-            return self.finish("success")
-        elif "success" in tags and self.greeted_flag:
-            self.greeted_flag = False
-            return self.finish("good_response")
-        elif "no" in tags and self.finish_flag:
-            return self.finish("cant_help")
-        else:
-            return self.go_to_state("confused")
+        return self._respond_from(state, message, self.tags)
 
     # greeting state functions
 
@@ -463,6 +738,7 @@ class OxyCSBot(ChatBot):
         self.greeted_flag = True
         return "I am here to help! How are you feeling today?"
 
+    @responds_like('waiting')
     def respond_from_greeting(self, message, tags):
         self.greeted_flag = True
         return self.respond_using("waiting", message)
@@ -477,12 +753,6 @@ class OxyCSBot(ChatBot):
             "Do you feel better?"
         ])
 
-    def respond_from_anxious_breathe(self, message, tags):
-        if "yes" in tags:
-            return self.finish("success")
-        elif "no" in tags or "idk" in tags:
-            return self.go_to_state("why_not")
-
     # suicidal_response_friends state functions
 
     def on_enter_suicidal_response_friends(self):
@@ -492,16 +762,6 @@ class OxyCSBot(ChatBot):
             "Do you have any friends, family, or anyone you can talk to right now?"
         ])
 
-    def respond_from_suicidal_response_friends(self, message, tags):
-        if "idk" in tags:
-            return self.finish('hotline_idk')
-        elif "no" in tags:
-            return self.finish('hotline')
-        elif "yes" in tags:
-            return self.finish('talk_to_friends')
-        else:
-            return self.go_to_state("confused")
-
     # "why_sad" state functions
 
     def on_enter_why_sad(self):
@@ -511,42 +771,6 @@ class OxyCSBot(ChatBot):
         ])
         return response
 
-    def respond_from_why_sad(self, message, tags):
-        if "sad" in tags:
-            return self.go_to_state('why_sad')
-        elif "good" in tags:
-            return self.finish("good_response")
-        elif "suicidal" in tags:
-            return self.go_to_state('suicidal_response_friends')
-        elif "anxious" in tags:
-            return self.go_to_state('anxious_breathe')
-        elif "social isolation" in tags:
-            return self.go_to_state("clubs")
-        elif "thanks" in tags and self.finish_flag:
-            return self.finish("thanks")
-        elif "thanks" in tags and not self.finish_flag:
-            return self.go_to_state("confused")
-        elif 'failing academics' in tags:
-            return self.go_to_state("talk_to_professors")
-        elif "idk" in tags:
-            return self.go_to_state("figure_out_feelings")
-        elif 'health issues' in tags:
-            return self.finish('health_resources')
-        elif "difficult courses" in tags:
-            return self.finish('academic_resources')
-        elif "courses overload" in tags:
-            return self.finish('course_overload_response')
-        elif "specific events" in tags:
-            return self.go_to_state("specific_event_response")
-        elif "help" in tags or "hi" in tags:
-            return self.go_to_state('greeting')
-        elif "no" in tags and self.finish_flag:
-            return self.finish("cant_help")
-        else:
-            return self.go_to_state("confused")
-
-        # FIXME add in specific_event
-
     # specific_events_reponse state functions
 
     def on_enter_specific_event_response(self):
@@ -554,6 +778,7 @@ class OxyCSBot(ChatBot):
             "Sounds like a rough experience. How has it effected your school experience?"
         ])
 
+    @responds_like('why_sad')
     def respond_from_specific_event_response(self, message, tags):
         return self.respond_using("why_sad", message)
 
@@ -565,30 +790,6 @@ class OxyCSBot(ChatBot):
             "Do you feel sad or maybe even overwhelmed?"
         ])
 
-    def respond_from_figure_out_feelings(self, message, tags):
-        if "sad" in tags or "yes" in tags or "no" in tags:
-            return self.go_to_state('why_sad')
-        elif "suicidal" in tags:
-            return self.go_to_state('suicidal_response_friends')
-        elif "anxious" in tags:
-            return self.go_to_state('anxious_breathe')
-        elif "social isolation" in tags:
-            return self.go_to_state("clubs")
-        elif "idk" in tags:
-            return self.go_to_state("why_sad")
-        elif 'health issues' in tags:
-            return self.finish('health_resources')
-        elif 'failing academics' in tags:
-            return self.go_to_state("talk_to_professors")
-        elif "difficult courses" in tags:
-            return self.finish('academic_resources')
-        elif "courses overload" in tags:
-            return self.finish('course_overload_response')
-        elif "help" in tags or "hi" in tags:
-            return self.go_to_state('greeting')
-        else:
-            return self.go_to_state("confused")
-
     # clubs state functions
 
     def on_enter_clubs(self):
@@ -601,55 +802,11 @@ class OxyCSBot(ChatBot):
 
         return response
 
-    def respond_from_clubs(self, message, tags):
-        if 'no' in tags:
-            return self.go_to_state('why_not')
-        elif 'yes' in tags:
-            return self.finish('join_clubs')
-        elif 'idk' in tags:
-            return self.finish('should_join_club')
-        else:
-            return self.go_to_state("confused")
-
     # why_not state fucntions
 
     def on_enter_why_not(self):
         return "Hmm, I see. Why not, if I might ask?"
 
-    def respond_from_why_not(self, message, tags):
-        if "sad" in tags:
-            return self.go_to_state('why_sad')
-        elif "good" in tags:
-            return self.finish("good_response")
-        elif "suicidal" in tags:
-            return self.go_to_state('suicidal_response_friends')
-        elif "anxious" in tags:
-            return self.go_to_state('anxious_breathe')
-        elif "thanks" in tags and self.finish_flag:
-            return self.finish("thanks")
-        elif "thanks" in tags and not self.finish_flag:
-            return self.go_to_state("confused")
-        elif "idk" in tags:
-            return self.go_to_state("figure_out_feelings")
-        elif 'health issues' in tags:
-            return self.finish('health_resources')
-        elif "difficult courses" in tags:
-            return self.finish('academic_resources')
-        elif 'failing academics' in tags:
-            return self.go_to_state("talk_to_professors")
-        elif "social isolation" in tags:
-            return self.go_to_state("clubs")
-        elif "courses overload" in tags:
-            return self.finish('course_overload_response')
-        elif "specific events" in tags:
-            return self.go_to_state("specific_event_response")
-        elif "help" in tags or "hi" in tags:
-            return self.go_to_state('greeting')
-        elif "no" in tags and self.finish_flag:
-            return self.finish("cant_help")
-        else:
-            return self.go_to_state("confused")
-
     # talk_to_professors state functions
 
     def on_enter_talk_to_professors(self):
@@ -660,14 +817,6 @@ class OxyCSBot(ChatBot):
 
         return response
 
-    def respond_from_talk_to_professors(self, messsage, tags):
-        if 'no' in tags:
-            return self.finish('talk_to_them')
-        elif 'yes' in tags:
-            return self.go_to_state('other_factors')
-        else:
-            return self.go_to_state("confused")
-
 
     # "other_factors" state functions
 
@@ -681,38 +830,6 @@ class OxyCSBot(ChatBot):
 
         return response
 
-    def respond_from_other_factors(self, message, tags):
-        if "sad" in tags:
-            return self.go_to_state('why_sad')
-        elif "good" in tags:
-            return self.finish("good_response")
-        elif "suicidal" in tags:
-            return self.go_to_state('suicidal_response_friends')
-        elif "anxious" in tags:
-            return self.go_to_state('anxious_breathe')
-        elif "thanks" in tags and self.finish_flag:
-            return self.finish("thanks")
-        elif "thanks" in tags and not self.finish_flag:
-            return self.go_to_state("confused")
-        elif "idk" in tags:
-            return self.go_to_state("figure_out_feelings")
-        elif "social isolation" in tags:
-            return self.go_to_state("clubs")
-        elif 'health issues' in tags:
-            return self.finish('health_resources')
-        elif "difficult courses" in tags:
-            return self.finish('academic_resources')
-        elif "courses overload" in tags:
-            return self.finish('course_overload_response')
-        elif "specific events" in tags:
-            return self.go_to_state("specific_event_response")
-        elif "help" in tags or "hi" in tags:
-            return self.go_to_state('greeting')
-        elif "no" in tags and self.finish_flag:
-            return self.finish("cant_help")
-        else:
-            return self.go_to_state("confused")
-
     # confused stated functions
 
     def on_enter_confused(self):
@@ -724,6 +841,7 @@ class OxyCSBot(ChatBot):
 
             ])
 
+    @goes_to('finish_fail', PREVIOUS)
     def respond_from_confused(self, message, tags):
         if self.try_count == 2: # if bot is confused twice in a row, fail the conversation
             self.try_count = 0
@@ -731,48 +849,6 @@ class OxyCSBot(ChatBot):
         else:
             return self.respond_using(self.prev_state, message)
 
-    # "specific_faculty" state functions
-
-    def on_enter_specific_faculty(self):
-        response = '\n'.join([
-            f"{self.professor.capitalize()}'s office hours are {self.get_office_hours(self.professor)}",
-            'Do you know where their office is?',
-        ])
-        return response
-
-    def respond_from_specific_faculty(self, message, tags):
-        if 'yes' in tags:
-            return self.finish('success')
-        else:
-            return self.finish('location')
-
-    # "unknown_faculty" state functions
-
-    def on_enter_unknown_faculty(self):
-        return "Who's office hours are you looking for?"
-
-    def respond_from_unknown_faculty(self, message, tags):
-        for professor in self.PROFESSORS:
-            if professor in tags:
-                self.professor = professor
-                return self.go_to_state('specific_faculty')
-        return self.go_to_state('unrecognized_faculty')
-
-    # "unrecognized_faculty" state functions
-
-    def on_enter_unrecognized_faculty(self):
-        return ' '.join([
-            "I'm not sure I understand - are you looking for",
-            "Celia, Hsing-hau, Jeff, Justin, or Kathryn?",
-        ])
-
-    def respond_from_unrecognized_faculty(self, message, tags):
-        for professor in self.PROFESSORS:
-            if professor in tags:
-                self.professor = professor
-                return self.go_to_state('specific_faculty')
-        return self.finish('fail')
-
     # "finish" functions
 
 
@@ -859,8 +935,15 @@ class OxyCSBot(ChatBot):
             "School can be rough to experience."
         ])
 
+    def finish_greeted_good_response(self):
+        # Only an "ok" right after the greeting uses up the greeting
+        self.greeted_flag = False
+        return self.finish_good_response()
+
 
 
 
 if __name__ == '__main__':
+    if '--check' in sys.argv[1:]:
+        sys.exit(0 if OxyCSBot().check() else 1)
     OxyCSBot().chat()
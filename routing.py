@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Weighted tag scoring for choosing a chatbot's next state."""
+
+from array import array
+
+
+class Router:
+    """Route messages by scoring their tags against a weight table.
+
+    Routes are declared per state as a list of rules::
+
+        (tag, target, weight)
+        (tag, target, weight, flag)
+
+    where `target` is either a state to go to or `finish_<manner>`, and a rule
+    with a `flag` only applies while that attribute of the chatbot is truthy.
+
+    The rules are compiled once into a sparse state x tag weight matrix, in
+    compressed sparse column form: the target and weight of every rule are
+    stored in two flat arrays, `target_ids` and `weights`, grouped by state,
+    flag and tag, and for each state (and flag) each tag maps to the range of
+    the arrays that holds its column. Routing a message is then a single
+    sparse dot product between that matrix and the message's tag counts, so
+    it only costs as much as the number of tags found in the message, no
+    matter how many rules a state has. The target with the highest score
+    wins; ties go to the rule that is listed first.
+    """
+
+    def __init__(self, routes, default):
+        """Compile a route table.
+
+        Arguments:
+            routes (Dict[str, List[tuple]]): The rules of each state.
+            default (str): The target when no rule matches.
+        """
+        self.default = default
+        self.targets = []
+        self.target_ids = array('H')
+        self.weights = array('d')
+        self.columns = {}
+        target_index = {}
+        for state, rules in routes.items():
+            columns = {}
+            for rule in rules:
+                tag, target, weight = rule[:3]
+                flag = rule[3] if len(rule) > 3 else None
+                if target not in target_index:
+                    target_index[target] = len(self.targets)
+                    self.targets.append(target)
+                column = columns.setdefault(flag, {}).setdefault(tag, [])
+                column.append((target_index[target], float(weight)))
+            # Unflagged rules are always scored, so they come first
+            blocks = [(None, columns.pop(None, {}))] + list(columns.items())
+            self.columns[state] = [
+                (flag, {tag: self._store(column) for tag, column in block.items()})
+                for flag, block in blocks
+            ]
+        self.rank = {
+            state: self._rank(rules, target_index)
+            for state, rules in routes.items()
+        }
+
+    def _store(self, column):
+        """Append a column to the arrays, returning the range it takes up."""
+        start = len(self.target_ids)
+        for target, weight in column:
+            self.target_ids.append(target)
+            self.weights.append(weight)
+        return range(start, len(self.target_ids))
+
+    @staticmethod
+    def _rank(rules, target_index):
+        """Order the targets of a state by where they are first listed."""
+        rank = {}
+        for position, rule in enumerate(rules):
+            rank.setdefault(target_index[rule[1]], -position)
+        return rank
+
+    def __contains__(self, state):
+        return state in self.columns
+
+    def scores(self, state, tags, bot=None):
+        """Score every target of a state against the tags of a message.
+
+        Arguments:
+            state (str): The current state.
+            tags (Dict[str, float]): The (weighted) tag counts of the message.
+            bot (ChatBot): The chatbot, used to look up rule flags.
+
+        Returns:
+            Dict[int, float]: The score of each target index with a match.
+        """
+        scores = {}
+        target_ids = self.target_ids
+        weights = self.weights
+        for flag, columns in self.columns[state]:
+            if flag is not None and not getattr(bot, flag, False):
+                continue
+            for tag, count in tags.items():
+                for i in columns.get(tag, ()):
+                    target = target_ids[i]
+                    scores[target] = scores.get(target, 0.0) + weights[i] * count
+        return scores
+
+    def route(self, state, tags, bot=None):
+        """Choose the target for a message.
+
+        Arguments:
+            state (str): The current state.
+            tags (Dict[str, float]): The (weighted) tag counts of the message.
+            bot (ChatBot): The chatbot, used to look up rule flags.
+
+        Returns:
+            str: The winning state or `finish_<manner>`.
+        """
+        scores = self.scores(state, tags, bot)
+        if not scores:
+            return self.default
+        rank = self.rank[state]
+        best = max(scores, key=lambda target: (scores[target], rank[target]))
+        return self.targets[best]
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""An HTTP interface to chatbots, for channels other than Slack.
+
+`POST /respond` answers one message:
+
+    {"conversation": "sms:+15550100", "text": "i'm so stressed", "session": {...}}
+
+and replies with the chatbot's response and the session of the conversation:
+
+    {"conversation": "sms:+15550100", "response": "...", "session": {...}}
+
+`POST /respond/batch` answers a list of such messages in one request
+(`{"messages": [...]}`), in order, and replies with `{"responses": [...]}`.
+Messages of the same conversation later in a batch carry on from the earlier
+ones.
+
+Each worker keeps the chatbot of every conversation it has answered recently,
+but under gunicorn the next message of a conversation may go to another
+worker. The session holds everything a chatbot needs to carry on (its state,
+previous state, flags, try count and the experiments it has seen, like a
+`snapshot` record), so clients should send back the last session they were
+given; it is used instead of the worker's own copy. Sessions name states, so
+they still work after a deploy, and states that have been renamed are looked
+up in RENAMED_STATES.
+
+Each worker counts the finishes of its own conversations for the chatbot's
+EXPERIMENTS and prints their reports (see `experiments.Experiment.report`)
+every minute, along with the stats of the fallback classifier if there is
+one; add up the reports of all workers. Abandoned conversations are not
+counted here: a worker cannot tell whether a conversation it stopped hearing
+from carried on with another worker.
+
+Run it with gunicorn (see `gunicorn.conf.py`), which loads the app once and
+forks its workers from it, so every worker shares the compiled lexicons,
+router and state graph instead of building its own:
+
+    gunicorn service:app
+
+or on its own, for development:
+
+    python3 service.py [port]
+"""
+
+from os import environ, getpid
+from time import time
+
+from flask import Flask, jsonify, request
+
+from lexicon import HAN_RUN_TOKEN
+from locales import HAN_CHARACTER
+from normalize import HAN_TOKEN, pattern
+from oxycsbot import OxyCSBot
+from transitions import get_transition_log
+
+MAX_TEXT = 4096
+MAX_BATCH = 100
+SESSION_FIELDS = {
+    'state': str,
+    'prev_state': str,
+    'finished': bool,
+    'greeted': bool,
+    'tries': int,
+    'experiments': list,
+}
+
+
+class BadRequest(ValueError):
+    """A request that cannot be answered."""
+
+
+def get_session(bot):
+    """Describe the state of a chatbot's conversation.
+
+    Arguments:
+        bot (ChatBot): The chatbot.
+
+    Returns:
+        Dict[str, Union[str, bool, int]]: The session of the conversation.
+    """
+    return {
+        'state': bot.state,
+        'prev_state': bot.prev_state,
+        'finished': bot.finish_flag,
+        'greeted': bot.greeted_flag,
+        'tries': bot.try_count,
+        'experiments': [experiment.name for experiment in bot.exposures or ()],
+    }
+
+
+def check_message(message):
+    """Check that a message can be answered.
+
+    Arguments:
+        message (Dict[str, Any]): The message, from the request.
+
+    Returns:
+        str: The id of its conversation.
+        str: Its text.
+
+    Raises:
+        BadRequest: If the message is malformed.
+    """
+    if not isinstance(message, dict):
+        raise BadRequest('a message must be an object')
+    conversation = message.get('conversation')
+    text = message.get('text')
+    if not isinstance(conversation, str) or not conversation:
+        raise BadRequest('"conversation" must be a non-empty string')
+    if not isinstance(text, str):
+        raise BadRequest('"text" must be a string')
+    if len(text) > MAX_TEXT:
+        raise BadRequest(f'"text" must be at most {MAX_TEXT} characters')
+    session = message.get('session')
+    if session is None:
+        return conversation, text
+    if not isinstance(session, dict):
+        raise BadRequest('"session" must be an object')
+    for field, kind in SESSION_FIELDS.items():
+        value = session.get(field)
+        # bool is a subclass of int, so check the exact type
+        if value is not None and type(value) is not kind:
+            raise BadRequest(f'"session.{field}" must be {kind.__name__}')
+    if not all(isinstance(name, str) for name in session.get('experiments') or ()):
+        raise BadRequest('"session.experiments" must be a list of names')
+    return conversation, text
+
+
+class ChatService:
+    """Answer messages from any number of conversations."""
+
+    def __init__(self, bot_class, timeout=3600):
+        """Initialize a ChatService.
+
+        Arguments:
+            bot_class (class): The class of the chatbots that will respond.
+            timeout (float): How many idle seconds a conversation is kept for.
+        """
+        self.bot_class = bot_class
+        self.timeout = timeout
+        self.bots = {}
+        self.next_expiry = time() + min(timeout, 60)
+        # Resolve state names to the strings in STATES, so restored states
+        # are the same objects as the ones the chatbot compares them to
+        self.states = {state: state for state in bot_class.STATES}
+        self.states[''] = ''
+        for old, new in bot_class.RENAMED_STATES.items():
+            self.states.setdefault(old, self.states[new])
+        self.experiments = {experiment.name: experiment for experiment in bot_class.EXPERIMENTS}
+
+    def restore(self, conversation, session):
+        """Turn a session back into a chatbot.
+
+        Arguments:
+            conversation (str): The id of the conversation.
+            session (Dict[str, Any]): The session, as made by `get_session`.
+
+        Returns:
+            ChatBot: The chatbot, or a new one if the session's state no
+                longer exists or could not have been reached.
+        """
+        bot = self.bot_class(conversation=conversation)
+        state = self.states.get(session.get('state'))
+        if state is None:
+            return bot
+        prev_state = self.states.get(session.get('prev_state'), bot.default_state)
+        if state == 'confused' and (
+                prev_state == 'confused' or prev_state not in self.bot_class._dispatch):
+            # The confused state answers from the previous one, so that must
+            # be a state that can answer on its own
+            return bot
+        bot.state = state
+        bot.prev_state = prev_state
+        bot.finish_flag = session.get('finished') is True
+        bot.greeted_flag = session.get('greeted') is True
+        tries = session.get('tries') or 0
+        bot.try_count = tries if 0 <= tries < 256 else 0
+        for name in session.get('experiments') or ():
+            experiment = self.experiments.get(name)
+            if experiment is not None:
+                experiment.assign(bot)
+        return bot
+
+    def respond(self, message, continuing=()):
+        """Respond to a message in its conversation.
+
+        Arguments:
+            message (Dict[str, Any]): The "conversation", "text" and,
+                optionally, "session" of the message.
+            continuing (Container[str]): Conversations whose chatbot is
+                already up to date, so any session sent with the message is
+                older than it.
+
+        Returns:
+            Dict[str, Any]: The conversation, the chatbot's response and the
+                new session.
+
+        Raises:
+            BadRequest: If the message is malformed.
+        """
+        conversation, text = check_message(message)
+        now = time()
+        session = message.get('session')
+        if session is not None and conversation not in continuing:
+            bot = self.bots[conversation] = self.restore(conversation, session)
+        else:
+            bot = self.bots.get(conversation)
+            if bot is None:
+                bot = self.bots[conversation] = self.bot_class(conversation=conversation)
+        bot.last_active = now
+        response = bot.respond(text)
+        result = {
+            'conversation': conversation,
+            'response': response,
+            'session': get_session(bot),
+        }
+        if bot.state == bot.default_state and not (bot.finish_flag or bot.greeted_flag):
+            # The conversation is over and a new chatbot would start the same way
+            del self.bots[conversation]
+        if now >= self.next_expiry:
+            self.sweep(now)
+        return result
+
+    def sweep(self, now):
+        """Forget idle conversations, and print what the worker has measured.
+
+        Arguments:
+            now (float): The current time, in seconds.
+        """
+        # Not counted as abandoned: the conversation may have carried on with
+        # another worker
+        idle = [key for key, bot in self.bots.items() if now - bot.last_active > self.timeout]
+        for key in idle:
+            del self.bots[key]
+        self.next_expiry = now + min(self.timeout, 60)
+        if self.bot_class.fallback is not None:
+            print(f'worker {getpid()} {self.bot_class.fallback.stats()}', flush=True)
+        for experiment in self.bot_class.EXPERIMENTS:
+            print(f'worker {getpid()} {experiment.report()}', flush=True)
+
+    def respond_all(self, messages):
+        """Respond to a batch of messages in order.
+
+        Arguments:
+            messages (List[Dict[str, Any]]): The messages.
+
+        Returns:
+            List[Dict[str, Any]]: The result of each message, like `respond`.
+
+        Raises:
+            BadRequest: If the batch or any of its messages is malformed;
+                none of the batch is answered then.
+        """
+        if not isinstance(messages, list):
+            raise BadRequest('"messages" must be a list')
+        if len(messages) > MAX_BATCH:
+            raise BadRequest(f'a batch can have at most {MAX_BATCH} messages')
+        for message in messages:
+            check_message(message)
+        results = []
+        continuing = set()
+        for message in messages:
+            results.append(self.respond(message, continuing))
+            continuing.add(message['conversation'])
+        return results
+
+
+def preload(bot_class):
+    """Build everything a chatbot class compiles lazily.
+
+    Under gunicorn this runs once before the workers are forked, so they share
+    the lexicon of every locale, the compiled patterns and the fallback model
+    instead of each building its own copy the first time it needs them.
+
+    Arguments:
+        bot_class (class): The chatbot class.
+    """
+    for locale in bot_class.LOCALES:
+        bot_class._lexicon.lexicon(locale)
+    pattern(HAN_TOKEN)
+    pattern(HAN_CHARACTER)
+    pattern(HAN_RUN_TOKEN)
+    if bot_class.fallback is not None:
+        bot_class.fallback.load()
+
+
+def create_app(bot_class):
+    """Make the HTTP app of a chatbot class.
+
+    TRANSITION_LOG and FALLBACK_MODEL are read from the environment like
+    `slackbot.run` does, and conversations idle for CONVERSATION_TIMEOUT
+    seconds (an hour by default) are forgotten.
+
+    Arguments:
+        bot_class (class): The class of the chatbots that will respond.
+
+    Returns:
+        Flask: The app.
+    """
+    bot_class.transition_log = get_transition_log()
+    if 'FALLBACK_MODEL' in environ:
+        from fallback import FallbackClassifier
+        bot_class.fallback = FallbackClassifier(environ['FALLBACK_MODEL'])
+    preload(bot_class)
+    service = ChatService(bot_class, float(environ.get('CONVERSATION_TIMEOUT', 3600)))
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_BATCH * MAX_TEXT * 2
+
+    def payload():
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise BadRequest('the request body must be a JSON object')
+        return body
+
+    @app.errorhandler(BadRequest)
+    def bad_request(error):
+        return jsonify(error=str(error)), 400
+
+    @app.route('/respond', methods=['POST'])
+    def respond():
+        return jsonify(service.respond(payload()))
+
+    @app.route('/respond/batch', methods=['POST'])
+    def respond_batch():
+        return jsonify(responses=service.respond_all(payload().get('messages')))
+
+    @app.route('/health')
+    def health():
+        return jsonify(conversations=len(service.bots))
+
+    app.service = service
+    return app
+
+
+app = create_app(OxyCSBot)
+
+
+if __name__ == '__main__':
+    import sys
+    app.run(port=int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 """An interface to Slack for chatbots."""
 
+from collections import deque
 from os import environ
-from time import sleep
-
-from slackclient import SlackClient
+from time import sleep, time
 
+from experiments import abandon
+from intake import Intake
 from oxycsbot import OxyCSBot # FIXME
+from transitions import get_transition_log
+from turns import TurnAggregator
 
 
 def get_token():
@@ -23,6 +26,73 @@ def get_token():
     raise NameError('"TOKEN" not defined in environment')
 
 
+def get_turn_window():
+    """Read the turn aggregation window from the environment.
+
+    Messages from the same user in the same channel that arrive within this
+    many seconds of each other are answered as one turn.
+
+    Returns:
+        float: The window in seconds. 0 (the default) disables aggregation.
+    """
+    return float(environ.get('TURN_WINDOW', 0))
+
+
+def load_snapshot(bot_class):
+    """Load the conversations saved by the previous worker, if any.
+
+    If SNAPSHOT is set to a file or a Redis URL, the worker saves its
+    conversations there when it is stopped, and the next worker resumes them
+    from it. The snapshot is removed once loaded, so the conversations are
+    only resumed once. A file only reaches the next worker if it runs on the
+    same filesystem; on Heroku, where every dyno gets a fresh one, use a Redis
+    URL (see `snapshot`).
+
+    Arguments:
+        bot_class (class): The class of the chatbots to restore.
+
+    Returns:
+        snapshot.Snapshot: The saved conversations, or None if there are none.
+    """
+    if 'SNAPSHOT' not in environ:
+        return None
+    from snapshot import Snapshot, describe, remove_snapshot
+    try:
+        saved = Snapshot.load(environ['SNAPSHOT'], bot_class)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        print(f'not resuming conversations: {error}')
+        return None
+    try:
+        remove_snapshot(environ['SNAPSHOT'])
+    except OSError as error:
+        print(f'not resuming conversations: {error}')
+        return None
+    print(f'resuming {len(saved)} conversations from {describe(environ["SNAPSHOT"])}')
+    return saved
+
+
+def get_intake(bot_class):
+    """Make the intake queue configured in the environment.
+
+    Once INTAKE_HIGH messages (500 by default) are waiting to be answered,
+    messages are shed until only INTAKE_LOW (half of INTAKE_HIGH by default)
+    are left; the bot's CRISIS_TAGS are never shed. At most BUSY_RATE (5 by
+    default) busy replies are sent a second.
+
+    Arguments:
+        bot_class (class): The class of the chatbot that will respond.
+
+    Returns:
+        Intake: The intake queue.
+    """
+    high = int(environ.get('INTAKE_HIGH', 500))
+    low = int(environ['INTAKE_LOW']) if 'INTAKE_LOW' in environ else None
+    busy_rate = float(environ.get('BUSY_RATE', 5))
+    return Intake(high, low, bot_class()._get_tags, bot_class.CRISIS_TAGS, busy_rate)
+
+
 def connect_to_slack():
     """Connect to Slack's real-time messaging interface.
 
@@ -33,6 +103,9 @@ def connect_to_slack():
     Raises:
         ConnectionError: If the connection to Slack fails.
     """
+    # slackclient pulls in requests and websocket, so only import it when
+    # actually connecting; tools that import this module start without it
+    from slackclient import SlackClient
     slack_client = SlackClient(get_token())
     if not slack_client.rtm_connect(with_team_state=False):
         raise ConnectionError('failed to connect to Slack RTM interface')
@@ -53,35 +126,222 @@ def get_at_message(event, bot_id):
     """
     if event['type'] != 'message' or 'subtype' in event:
         return None
-    if ' ' not in event['text']:
-        return None
-    user_id, message = event['text'].split(' ', maxsplit=1)
-    if user_id != ('<@' + bot_id + '>'):
+    # Check the mention in place instead of splitting off a copy of it
+    mention = f'<@{bot_id}> '
+    if not event['text'].startswith(mention):
         return None
-    return message.strip()
+    return event['text'][len(mention):].strip()
+
 
+def reply(slack, bots, bot_class, key, message, tags=None, saved=None):
+    """Respond to a message in its conversation and post the response.
 
-def run(bot_class):
+    Arguments:
+        slack (SlackClient): A Slack API object.
+        bots (Dict[Tuple[str, str], ChatBot]): The chatbot of each
+            conversation, keyed by channel and user.
+        bot_class (class): The class of the chatbot that will respond.
+        key (Tuple[str, str]): The channel and user of the message.
+        message (str): The message from the user.
+        tags (Dict[str, int]): The tags of the message, if already counted.
+        saved (snapshot.Snapshot): Conversations saved by the previous
+            worker, resumed on their next message. Optional.
+    """
+    bot = bots.get(key)
+    if bot is None:
+        bot = saved.take(key) if saved else None
+        if bot is None:
+            bot = bot_class(conversation=key)
+        bots[key] = bot
+    bot.last_active = time()
+    response = bot.respond(message, tags)
+    if bot.state == bot.default_state and not (bot.finish_flag or bot.greeted_flag):
+        # The conversation is over and a new chatbot would start the same way
+        del bots[key]
+    slack.api_call('chat.postMessage', channel=key[0], text=response)
+
+
+def answer(slack, intake, turns, ready, bots, bot_class, saved, deadline):
+    """Answer queued messages and ready turns until there are none or time is up.
+
+    Arguments:
+        slack (SlackClient): A Slack API object.
+        intake (Intake): The queued messages.
+        turns (TurnAggregator): Where to merge messages into turns, or None
+            to answer every message.
+        ready (Deque[Tuple[Tuple[str, str], str, Dict[str, float]]]): Turns
+            released by `turns` that have not been answered yet; those left
+            when time is up are answered next time.
+        bots (Dict[Tuple[str, str], ChatBot]): The chatbot of each
+            conversation.
+        bot_class (class): The class of the chatbot that will respond.
+        saved (snapshot.Snapshot): Conversations saved by the previous
+            worker, or None.
+        deadline (float): When to stop answering, in seconds.
+    """
+    while intake and time() < deadline:
+        key, message, tags = intake.get()
+        if turns:
+            turns.add(key, message, time())
+        else:
+            reply(slack, bots, bot_class, key, message, tags, saved)
+    if turns:
+        ready.extend(turns.pop_ready(time()))
+    while ready and time() < deadline:
+        key, message, tags = ready.popleft()
+        reply(slack, bots, bot_class, key, message, tags, saved)
+
+
+def expire_conversations(bots, now, timeout):
+    """Forget conversations that have been idle for too long.
+
+    The experiments they had seen count them as abandoned.
+
+    Arguments:
+        bots (Dict[Tuple[str, str], ChatBot]): The chatbot of each
+            conversation.
+        now (float): The current time, in seconds.
+        timeout (float): How many idle seconds a conversation is kept for.
+    """
+    idle = [key for key, bot in bots.items() if now - bot.last_active > timeout]
+    for key in idle:
+        abandon(bots.pop(key))
+
+
+def save_snapshot(bots, saved):
+    """Save the conversations of this worker for the next one.
+
+    Arguments:
+        bots (Dict[Tuple[str, str], ChatBot]): The chatbot of each
+            conversation.
+        saved (snapshot.Snapshot): Conversations saved by the previous worker
+            that were never resumed, or None.
+    """
+    from itertools import chain
+    from snapshot import conversation_record, describe, write_snapshot
+    records = map(conversation_record, bots.values())
+    if saved:
+        records = chain(records, saved.records())
+    count = write_snapshot(environ['SNAPSHOT'], records)
+    print(f'saved {count} conversations to {describe(environ["SNAPSHOT"])}')
+
+
+def run(bot_class, connect=connect_to_slack, bots=None, intake=None):
     """Connect the chatbot to Slack.
 
     After connecting to Slack, this function will loop forever checking for
     messages from Slack. The current interface to Slack only lets through @-
     messages, _not_ direct messages.
 
+    Each user in each channel has their own conversation with the chatbot. If
+    TURN_WINDOW is set, quick successive messages are merged into one turn.
+    If FALLBACK_MODEL is set to a model trained by `train_fallback.py`,
+    messages that match no TAGS are classified with it, and its stats are
+    printed every minute along with the intake's.
+
+    POLL_INTERVAL sets how many seconds to wait between reads from Slack (1 by
+    default). Conversations idle for CONVERSATION_TIMEOUT seconds (an hour by
+    default) are forgotten.
+
+    Messages are queued as they are read, and answered for up to
+    POLL_INTERVAL seconds before reading again. When too many are waiting,
+    messages are shed (see `get_intake`), and some are answered with the
+    bot's BUSY_RESPONSE instead. Messages of conversations in one of the
+    bot's CRISIS_STATES are never shed, and are answered first.
+
+    If SNAPSHOT is set, conversations saved by the previous worker are
+    resumed, and on SIGTERM the worker answers the messages it is holding
+    (for up to SHUTDOWN_SECONDS, 10 by default), saves its conversations to
+    SNAPSHOT and returns. The previous worker may still be stopping when this
+    one starts (Heroku starts the new dyno as it stops the old one), so for
+    SNAPSHOT_WAIT seconds (30 by default) the worker keeps checking for a
+    snapshot until it finds one.
+
     Arguments:
         bot_class (class): The class of the chatbot that will respond.
+        connect (Callable[[], Tuple[SlackClient, str]]): Connects to Slack;
+            `connect_to_slack` by default. Load tests pass a fake.
+        bots (Dict[Tuple[str, str], ChatBot]): Where to keep the chatbot of
+            each conversation. Optional.
+        intake (Intake): Where to queue incoming messages; `get_intake()` by
+            default. Load tests pass their own to read its counts.
     """
-    slack, bot_id = connect_to_slack()
-    bot = bot_class()
-    while True:
+    bot_class.transition_log = get_transition_log()
+    if 'FALLBACK_MODEL' in environ:
+        from fallback import FallbackClassifier
+        bot_class.fallback = FallbackClassifier(environ['FALLBACK_MODEL'])
+    saved = load_snapshot(bot_class)
+    # Check for the previous worker's snapshot every few seconds until it
+    # turns up or the wait is over
+    snapshot_wait = time() + float(environ.get('SNAPSHOT_WAIT', 30)) if 'SNAPSHOT' in environ else 0
+    next_snapshot_check = time() + 5
+    slack, bot_id = connect()
+    if bots is None:
+        bots = {}
+    if intake is None:
+        intake = get_intake(bot_class)
+    stopping = []
+    if 'SNAPSHOT' in environ:
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    window = get_turn_window()
+    interval = float(environ.get('POLL_INTERVAL', 1))
+    timeout = float(environ.get('CONVERSATION_TIMEOUT', 3600))
+    next_expiry = time() + min(timeout, 60)
+    turns = TurnAggregator(bot_class()._get_tags, window) if window > 0 else None
+    ready = deque()
+    if turns is not None:
+        # Pending and released turns are waiting to be answered as much as
+        # queued messages are, so they count towards the intake's watermarks
+        intake.holding = lambda: len(turns) + len(ready)
+    crisis_states = frozenset(bot_class.CRISIS_STATES)
+
+    def in_crisis(key):
+        # Replies in a crisis conversation often have no crisis tags of
+        # their own ("no", "idk"), so the conversation's state decides
+        bot = bots.get(key)
+        if bot is None:
+            return saved is not None and saved.state(key) in crisis_states
+        return bot.state in crisis_states or (
+            bot.state == 'confused' and bot.prev_state in crisis_states)
+
+    intake.in_crisis = in_crisis
+    while not stopping:
         for event in slack.rtm_read():
             print(event)
             message = get_at_message(event, bot_id)
             if message:
-                channel = event['channel']
-                response = bot.respond(message)
-                slack.api_call('chat.postMessage', channel=channel, text=response)
-        sleep(1)
+                key = (event['channel'], event.get('user'))
+                if not intake.put(key, message) and intake.tell_busy(key, time()):
+                    slack.api_call('chat.postMessage', channel=key[0], text=bot_class.BUSY_RESPONSE)
+        answer(slack, intake, turns, ready, bots, bot_class, saved, time() + interval)
+        if saved is None and next_snapshot_check <= time() < snapshot_wait:
+            saved = load_snapshot(bot_class)
+            if saved:
+                # Conversations answered while waiting have moved on
+                saved.discard(bots)
+            next_snapshot_check = time() + 5
+        if time() >= next_expiry:
+            expire_conversations(bots, time(), timeout)
+            if saved:
+                saved.expire(time(), timeout)
+            next_expiry = time() + min(timeout, 60)
+            print(intake.stats())
+            if bot_class.fallback is not None:
+                print(bot_class.fallback.stats())
+            for experiment in bot_class.EXPERIMENTS:
+                print(experiment.report())
+        if not intake and not ready:
+            sleep(min(interval, window) if turns else interval)
+
+    deadline = time() + float(environ.get('SHUTDOWN_SECONDS', 10))
+    answer(slack, intake, turns, ready, bots, bot_class, saved, deadline)
+    if turns:
+        ready.extend(turns.pop_ready(float('inf')))
+        answer(slack, intake, None, ready, bots, bot_class, saved, deadline)
+    if intake or ready:
+        print(f'stopped with {intake.depth()} messages unanswered')
+    save_snapshot(bots, saved)
 
 
 if __name__ == '__main__':
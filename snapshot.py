@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""Snapshots of live conversations, handed from one worker to the next.
+
+When a worker is stopped (eg. by a deploy), `write_snapshot` saves the state
+of every conversation it is holding, and the next worker picks them up with
+`Snapshot.load` instead of starting everyone over in the default state.
+Loading only indexes the conversations; each one is turned back into a
+chatbot when its user next sends a message (see `Snapshot.take`).
+
+A snapshot file starts with MAGIC and a header holding the format VERSION,
+the number of names and the number of conversations. Then come the names:
+every state a conversation is in and every experiment it has seen, as an
+8-bit length and the UTF-8 name. Each conversation is then stored as the
+time of its last message, the 16-bit ids of its state and previous state,
+8-bit flags and try count, the 8-bit lengths of its channel and user and
+number of experiments, the UTF-8 channel and user, and the 16-bit id of each
+experiment it has seen since it last finished (see `experiments`). Version 1
+snapshots, from before experiments were saved, can still be loaded.
+
+States are stored by name, so a snapshot can be restored by a newer version
+of the chatbot. States that have been renamed are looked up in the chatbot's
+RENAMED_STATES; conversations in states that no longer exist start over.
+Experiments are stored by name too, and ones that no longer exist are
+skipped.
+
+A snapshot is kept either in a file or, if its location is a `redis://` or
+`rediss://` URL, under the REDIS_KEY of that Redis database. A file only
+hands conversations over between workers that share a filesystem, like
+successive runs of the worker on one machine. Where each worker starts on a
+fresh filesystem of its own, as Heroku dynos do, a file snapshot is lost with
+the worker that wrote it, so use Redis there (the redis package is then
+needed). Either way there is one snapshot per location, so workers running
+side by side each need their own.
+"""
+
+import os
+import struct
+from urllib.parse import urlsplit
+
+from experiments import ABANDONED
+
+MAGIC = b'RUOKSNAP'
+VERSION = 2
+HEADER = struct.Struct('<HHI')
+NAME = struct.Struct('<B')
+CONVERSATION = struct.Struct('<dHHBBBBB')
+CONVERSATION_V1 = struct.Struct('<dHHBBBB')
+EXPERIMENT = struct.Struct('<H')
+
+FINISHED = 1
+GREETED = 2
+NO_USER = 4
+
+REDIS_SCHEMES = ('redis://', 'rediss://')
+REDIS_KEY = 'snapshot'
+
+
+def is_redis(location):
+    """Tell whether a snapshot location is a Redis URL."""
+    return location.startswith(REDIS_SCHEMES)
+
+
+def describe(location):
+    """Name a snapshot location for messages, without any Redis password."""
+    if not is_redis(location):
+        return location
+    parts = urlsplit(location)
+    host = parts.hostname or 'localhost'
+    port = f':{parts.port}' if parts.port else ''
+    return f'{parts.scheme}://{host}{port}{parts.path}'
+
+
+def _redis_call(location, method, *args):
+    """Call a method of a Redis client for a location.
+
+    Raises:
+        OSError: If Redis cannot be reached or refuses the call.
+    """
+    import redis
+    try:
+        return getattr(redis.Redis.from_url(location), method)(*args)
+    except redis.RedisError as error:
+        raise OSError(f'{describe(location)}: {error}') from error
+
+
+def read_snapshot(location):
+    """Read the contents of a snapshot.
+
+    Arguments:
+        location (str): The snapshot file or Redis URL.
+
+    Returns:
+        bytes: The snapshot.
+
+    Raises:
+        FileNotFoundError: If there is no snapshot there.
+        OSError: If the snapshot cannot be read.
+    """
+    if not is_redis(location):
+        with open(location, 'rb') as snapshot:
+            return snapshot.read()
+    data = _redis_call(location, 'get', REDIS_KEY)
+    if data is None:
+        raise FileNotFoundError(f'no snapshot in {describe(location)}')
+    return data
+
+
+def remove_snapshot(location):
+    """Remove a snapshot, so its conversations are only resumed once.
+
+    Arguments:
+        location (str): The snapshot file or Redis URL.
+    """
+    if is_redis(location):
+        _redis_call(location, 'delete', REDIS_KEY)
+    else:
+        os.remove(location)
+
+
+def conversation_record(bot):
+    """Describe the state of a chatbot's conversation.
+
+    Arguments:
+        bot (ChatBot): The chatbot; its `conversation` must be a (channel,
+            user) pair.
+
+    Returns:
+        Tuple[Tuple[str, str], str, str, int, int, float, Tuple[str, ...]]:
+            The channel and user, state, previous state, flags, try count and
+            time of the last message of the conversation, and the names of
+            the experiments it has seen.
+    """
+    flags = (FINISHED if bot.finish_flag else 0) | (GREETED if bot.greeted_flag else 0)
+    experiments = tuple(experiment.name for experiment in bot.exposures or ())
+    return (bot.conversation, bot.state, bot.prev_state, flags, bot.try_count,
+            bot.last_active, experiments)
+
+
+def write_snapshot(location, records):
+    """Save the state of some conversations.
+
+    A file snapshot is written to a temporary file and then moved into place,
+    and a Redis snapshot is set in one command, so a worker killed while
+    writing never leaves half a snapshot behind.
+
+    Arguments:
+        location (str): The snapshot file or Redis URL.
+        records (Iterable[Tuple]): Each conversation, as described by
+            `conversation_record` or `Snapshot.records`.
+
+    Returns:
+        int: The number of conversations saved.
+    """
+    names = {}
+    chunks = []
+    count = 0
+    for (channel, user), state, prev_state, flags, try_count, last_active, experiments in records:
+        if user is None:
+            flags |= NO_USER
+        channel = channel.encode('utf-8')
+        user = b'' if user is None else user.encode('utf-8')
+        chunks.append(CONVERSATION.pack(
+            last_active,
+            names.setdefault(state, len(names)),
+            names.setdefault(prev_state, len(names)),
+            flags,
+            min(try_count, 255),
+            len(channel),
+            len(user),
+            len(experiments),
+        ))
+        chunks.append(channel)
+        chunks.append(user)
+        for name in experiments:
+            chunks.append(EXPERIMENT.pack(names.setdefault(name, len(names))))
+        count += 1
+
+    header = [MAGIC, HEADER.pack(VERSION, len(names), count)]
+    for name in names:
+        encoded = name.encode('utf-8')
+        header.append(NAME.pack(len(encoded)))
+        header.append(encoded)
+
+    if is_redis(location):
+        _redis_call(location, 'set', REDIS_KEY, b''.join(header) + b''.join(chunks))
+        return count
+    temporary = f'{location}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as snapshot:
+        snapshot.write(b''.join(header))
+        snapshot.write(b''.join(chunks))
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(temporary, location)
+    return count
+
+
+class Snapshot:
+    """The conversations of a snapshot that have not been resumed yet."""
+
+    def __init__(self, bot_class, data, states, experiments, index, version=VERSION):
+        """Initialize a Snapshot; use `Snapshot.load` instead.
+
+        Arguments:
+            bot_class (class): The class of the chatbots to restore.
+            data (bytes): The contents of the snapshot.
+            states (List[str]): The current name of each state id, or None
+                for states that no longer exist.
+            experiments (List[experiments.Experiment]): The experiment of each
+                name id, or None for names that are not experiments.
+            index (Dict[Tuple[str, str], int]): Where each conversation is
+                stored in `data`.
+            version (int): The format version of `data`.
+        """
+        self.bot_class = bot_class
+        self.data = data
+        self.states = states
+        self.experiments = experiments
+        self.index = index
+        self.conversation = CONVERSATION if version == VERSION else CONVERSATION_V1
+        self.dropped = 0
+
+    @classmethod
+    def load(cls, location, bot_class):
+        """Index the conversations of a snapshot.
+
+        Arguments:
+            location (str): The snapshot file or Redis URL.
+            bot_class (class): The class of the chatbots to restore.
+
+        Returns:
+            Snapshot: The conversations of the snapshot.
+
+        Raises:
+            FileNotFoundError: If there is no snapshot there.
+            OSError: If the snapshot cannot be read.
+            ValueError: If it is not a snapshot this version can read.
+        """
+        data = read_snapshot(location)
+        try:
+            return cls._parse(describe(location), data, bot_class)
+        except struct.error:
+            raise ValueError(f'{describe(location)} is cut short')
+
+    @classmethod
+    def _parse(cls, name, data, bot_class):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{name} is not a conversation snapshot')
+        version, name_count, count = HEADER.unpack_from(data, len(MAGIC))
+        if version not in (1, VERSION):
+            raise ValueError(f'{name} has snapshot version {version}, not {VERSION}')
+
+        # Resolve names to the strings in STATES, so restored states are the
+        # same objects as the ones the chatbot compares them to
+        current = {state: state for state in bot_class.STATES}
+        current[''] = ''
+        for old, new in bot_class.RENAMED_STATES.items():
+            current.setdefault(old, current[new])
+        experiments = {experiment.name: experiment for experiment in bot_class.EXPERIMENTS}
+        offset = len(MAGIC) + HEADER.size
+        states = []
+        named_experiments = []
+        for _ in range(name_count):
+            length, = NAME.unpack_from(data, offset)
+            offset += NAME.size
+            name = data[offset:offset + length].decode('utf-8')
+            states.append(current.get(name))
+            named_experiments.append(experiments.get(name))
+            offset += length
+
+        index = {}
+        conversation = CONVERSATION if version == VERSION else CONVERSATION_V1
+        unpack_from = conversation.unpack_from
+        size = conversation.size
+        for _ in range(count):
+            fields = unpack_from(data, offset)
+            flags, channel_length, user_length = fields[3], fields[5], fields[6]
+            start = offset + size
+            end = start + channel_length
+            channel = data[start:end].decode('utf-8')
+            user = None if flags & NO_USER else data[end:end + user_length].decode('utf-8')
+            index[channel, user] = offset
+            offset = end + user_length
+            if version == VERSION:
+                offset += fields[7] * EXPERIMENT.size
+        if offset != len(data):
+            raise ValueError(f'{name} is corrupt')
+        return cls(bot_class, data, states, named_experiments, index, version)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _read(self, offset):
+        """Read a saved conversation.
+
+        Returns:
+            Tuple[float, int, int, int, int, List[experiments.Experiment]]:
+                The time of its last message, the ids of its state and
+                previous state, its flags and try count, and the experiments
+                it has seen that still exist.
+        """
+        fields = self.conversation.unpack_from(self.data, offset)
+        last_active, state_id, prev_id, flags, try_count, channel_length, user_length = fields[:7]
+        seen = []
+        if len(fields) > 7 and fields[7]:
+            start = offset + self.conversation.size + channel_length + user_length
+            ids = self.data[start:start + fields[7] * EXPERIMENT.size]
+            seen = [
+                self.experiments[name_id] for name_id, in EXPERIMENT.iter_unpack(ids)
+                if self.experiments[name_id] is not None
+            ]
+        return last_active, state_id, prev_id, flags, try_count, seen
+
+    def take(self, key):
+        """Turn a saved conversation back into a chatbot.
+
+        Arguments:
+            key (Tuple[str, str]): The channel and user of the conversation.
+
+        Returns:
+            ChatBot: The chatbot, in the state it was saved in, or None if the
+                conversation was not saved or its state no longer exists.
+        """
+        offset = self.index.pop(key, None)
+        if offset is None:
+            return None
+        last_active, state_id, prev_id, flags, try_count, seen = self._read(offset)
+        state = self.states[state_id]
+        if state is None:
+            self.dropped += 1
+            return None
+        bot = self.bot_class(conversation=key)
+        bot.state = state
+        prev_state = self.states[prev_id]
+        bot.prev_state = bot.default_state if prev_state is None else prev_state
+        bot.finish_flag = bool(flags & FINISHED)
+        bot.greeted_flag = bool(flags & GREETED)
+        bot.try_count = try_count
+        bot.last_active = last_active
+        for experiment in seen:
+            experiment.assign(bot)
+        return bot
+
+    def state(self, key):
+        """Find the state a saved conversation is in, without resuming it.
+
+        Arguments:
+            key (Tuple[str, str]): The channel and user of the conversation.
+
+        Returns:
+            str: The state, or None if the conversation was not saved or its
+                state no longer exists.
+        """
+        offset = self.index.get(key)
+        if offset is None:
+            return None
+        return self.states[self.conversation.unpack_from(self.data, offset)[1]]
+
+    def discard(self, keys):
+        """Forget saved conversations that have started over without them.
+
+        Arguments:
+            keys (Iterable[Tuple[str, str]]): The channel and user of each
+                conversation.
+        """
+        for key in keys:
+            self.index.pop(key, None)
+
+    def records(self):
+        """Describe the saved conversations whose states still exist.
+
+        This does not make chatbots, so the conversations that were never
+        resumed can be saved again quickly.
+
+        Yields:
+            Tuple: Each conversation, like `conversation_record`.
+        """
+        states = self.states
+        for key, offset in self.index.items():
+            last_active, state_id, prev_id, flags, try_count, seen = self._read(offset)
+            state = states[state_id]
+            if state is None:
+                continue
+            prev_state = states[prev_id]
+            if prev_state is None:
+                prev_state = self.bot_class.DEFAULT_STATE
+            yield (key, state, prev_state, flags & ~NO_USER, try_count, last_active,
+                   tuple(experiment.name for experiment in seen))
+
+    def expire(self, now, timeout):
+        """Forget saved conversations that have been idle for too long.
+
+        The experiments they had seen count them as abandoned.
+
+        Arguments:
+            now (float): The current time, in seconds.
+            timeout (float): How many idle seconds a conversation is kept for.
+        """
+        unpack_from = self.conversation.unpack_from
+        idle = [
+            key for key, offset in self.index.items()
+            if now - unpack_from(self.data, offset)[0] > timeout
+        ]
+        for key in idle:
+            for experiment in self._read(self.index.pop(key))[-1]:
+                experiment.record(experiment.variant_of(key), ABANDONED)
+        if not self.index:
+            self.data = b''
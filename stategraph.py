@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Compile a chatbot's states into a checked transition graph.
+
+The transitions of a state come from its ROUTES, or, for states with a
+`respond_from_*` method, from the targets declared on that method:
+
+    @goes_to('finish_fail', PREVIOUS)
+    def respond_from_confused(self, message, tags):
+        ...
+
+    @responds_like('waiting')
+    def respond_from_greeting(self, message, tags):
+        ...
+
+`compile_graph` builds the graph once, when a chatbot class is created, and
+refuses classes with missing methods, unknown targets, unreachable states or
+states that can never finish. `analyze` additionally reads the source of the
+`respond_from_*` methods to find ones that can return without responding, or
+whose declared targets do not match what they call; it is too slow for every
+start, so it is only run by `python3 oxycsbot.py --check`.
+"""
+
+from types import MappingProxyType
+
+PREVIOUS = '<previous>'
+
+
+class StateGraphError(ValueError):
+    """A chatbot's states do not form a valid conversation."""
+
+
+def goes_to(*targets):
+    """Declare the states and `finish_*` targets a respond_from_* method uses.
+
+    Arguments:
+        *targets (str): States, `finish_<manner>`, or PREVIOUS for the state
+            the chatbot was in before this one.
+    """
+    def decorate(method):
+        method.targets = targets
+        return method
+    return decorate
+
+
+def responds_like(state):
+    """Declare that a respond_from_* method responds as another state does.
+
+    Arguments:
+        state (str): The state whose response it uses.
+    """
+    def decorate(method):
+        method.delegate = state
+        return method
+    return decorate
+
+
+def _route_handler(state):
+    """Make a dispatch function for a state that routes on its ROUTES."""
+    def respond(bot, message, tags):
+        return bot.route(state, tags)
+    return respond
+
+
+def compile_graph(cls):
+    """Compile the transition graph and dispatch tables of a chatbot class.
+
+    Arguments:
+        cls (class): A ChatBot subclass with STATES and a DEFAULT_STATE.
+
+    Returns:
+        Dict[str, FrozenSet[str]]: The targets of each state.
+        Mapping[str, Callable]: The respond function of each state.
+        Mapping[str, Callable]: The on_enter function of each state.
+
+    Raises:
+        StateGraphError: If the states do not form a valid conversation.
+    """
+    problems = []
+    default = cls.DEFAULT_STATE
+    states = list(cls.STATES)
+    if default not in states:
+        raise StateGraphError(f'{cls.__name__}: default state "{default}" is not in STATES')
+
+    dispatch = {}
+    on_enter = {}
+    declared = {}
+    delegates = {}
+    for state in states:
+        if state != default:
+            method = getattr(cls, f'on_enter_{state}', None)
+            if method is None:
+                problems.append(f'state "{state}" has no on_enter_{state}')
+            on_enter[state] = method
+        if state in cls.ROUTES:
+            dispatch[state] = _route_handler(state)
+            declared[state] = {rule[1] for rule in cls.ROUTES[state]}
+            declared[state].add(cls.FALLBACK_ROUTE)
+            continue
+        method = getattr(cls, f'respond_from_{state}', None)
+        if method is None:
+            problems.append(f'state "{state}" has neither ROUTES nor respond_from_{state}')
+            continue
+        dispatch[state] = method
+        if hasattr(method, 'delegate'):
+            delegates[state] = method.delegate
+            declared[state] = set()
+        elif hasattr(method, 'targets'):
+            declared[state] = set(method.targets)
+        else:
+            problems.append(
+                f'respond_from_{state} does not declare its targets with @goes_to or @responds_like')
+
+    for state, targets in declared.items():
+        for target in targets:
+            if target == PREVIOUS:
+                continue
+            if target is None:
+                problems.append(f'state "{state}" has ROUTES but no FALLBACK_ROUTE')
+            elif target.startswith('finish_'):
+                if not callable(getattr(cls, target, None)):
+                    problems.append(f'state "{state}" finishes with undefined {target}')
+            elif target not in states or target == default:
+                problems.append(f'state "{state}" goes to invalid state "{target}"')
+    for state, delegate in delegates.items():
+        if delegate not in declared:
+            problems.append(f'state "{state}" responds like unknown state "{delegate}"')
+    for old, new in cls.RENAMED_STATES.items():
+        if new not in states:
+            problems.append(f'renamed state "{old}" goes to invalid state "{new}"')
+    if problems:
+        raise StateGraphError(_describe(cls, problems))
+
+    graph = _resolve(declared, delegates)
+    problems.extend(_check_reachability(graph, states, default))
+    if problems:
+        raise StateGraphError(_describe(cls, problems))
+    return graph, MappingProxyType(dispatch), MappingProxyType(on_enter)
+
+
+def _resolve(declared, delegates):
+    """Expand delegation and PREVIOUS targets into plain edges."""
+    edges = {state: set(targets) for state, targets in declared.items()}
+    changed = True
+    while changed:
+        changed = False
+        for state in edges:
+            targets = set(edges[state])
+            if state in delegates:
+                targets |= edges[delegates[state]]
+            if PREVIOUS in targets:
+                for source, source_targets in edges.items():
+                    if state in source_targets:
+                        targets |= source_targets
+            if targets != edges[state]:
+                edges[state] = targets
+                changed = True
+    return {state: frozenset(targets - {PREVIOUS}) for state, targets in edges.items()}
+
+
+def _check_reachability(graph, states, default):
+    """Find unreachable states and states that can never finish.
+
+    Every `finish_*` target leads back to the default state, where all
+    conversations start, so it adds nothing to what is reachable.
+    """
+    problems = []
+    reached = {default}
+    frontier = [default]
+    while frontier:
+        for target in graph.get(frontier.pop(), ()):
+            if target not in reached and target in graph:
+                reached.add(target)
+                frontier.append(target)
+    for state in states:
+        if state not in reached:
+            problems.append(f'state "{state}" can never be reached from "{default}"')
+
+    finishing = {
+        state for state, targets in graph.items()
+        if any(target.startswith('finish_') for target in targets)
+    }
+    changed = True
+    while changed:
+        changed = False
+        for state, targets in graph.items():
+            if state not in finishing and targets & finishing:
+                finishing.add(state)
+                changed = True
+    for state in states:
+        if state in reached and state not in finishing:
+            problems.append(f'state "{state}" is a dead end: no path from it finishes')
+    return problems
+
+
+def _describe(cls, problems):
+    return '\n'.join([f'{cls.__name__} has an invalid state graph:'] + [
+        f'  {problem}' for problem in problems
+    ])
+
+
+def analyze(cls):
+    """Check the source of a chatbot's respond_from_* methods.
+
+    Finds methods that can return without calling `go_to_state`, `finish` or
+    `respond_using` (so the chatbot would reply with None), and methods whose
+    calls do not match their @goes_to declaration.
+
+    Arguments:
+        cls (class): A ChatBot subclass.
+
+    Returns:
+        List[str]: A description of each problem found.
+    """
+    import ast
+    import inspect
+    import textwrap
+
+    problems = []
+    for state, method in cls._dispatch.items():
+        if state in cls.ROUTES:
+            continue
+        tree = ast.parse(textwrap.dedent(inspect.getsource(method)))
+        function = tree.body[0]
+        if not _always_returns(function.body):
+            problems.append(
+                f'WARNING: respond_from_{state} can return None on some messages')
+        called = _called_targets(function)
+        if hasattr(method, 'delegate'):
+            expected = {f'like:{method.delegate}'}
+        else:
+            expected = set(method.targets)
+        if called != expected:
+            problems.append(' '.join([
+                f'WARNING: respond_from_{state} calls {sorted(called)}',
+                f'but declares {sorted(expected)}',
+            ]))
+    return problems
+
+
+def _always_returns(body):
+    """Check whether a list of statements returns or raises on every path."""
+    import ast
+    for statement in body:
+        if isinstance(statement, (ast.Return, ast.Raise)):
+            return True
+        if isinstance(statement, ast.If):
+            if _always_returns(statement.body) and _always_returns(statement.orelse):
+                return True
+    return False
+
+
+def _called_targets(function):
+    """Collect the targets of go_to_state, finish and respond_using calls."""
+    import ast
+    targets = set()
+    for node in ast.walk(function):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        if not node.args:
+            continue
+        argument = node.args[0]
+        name = node.func.attr
+        value = _string(argument)
+        if value is not None:
+            if name == 'go_to_state':
+                targets.add(value)
+            elif name == 'finish':
+                targets.add(f'finish_{value}')
+            elif name == 'respond_using':
+                targets.add(f'like:{value}')
+        elif (name == 'respond_using' and isinstance(argument, ast.Attribute)
+                and argument.attr == 'prev_state'):
+            targets.add(PREVIOUS)
+    return targets
+
+
+def _string(node):
+    """Get the value of a string literal node, or None."""
+    import ast
+    if type(node).__name__ == 'Str':  # Python < 3.8
+        return node.s
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""Train the fallback classifier used when a message matches no TAGS.
+
+The training examples come from the chatbot's own lexicon and from replayed
+transcripts. Each lexicon phrase is also put in the same few carrier sentences
+("i feel so ...", "i'm ..."), so that the words around a phrase are seen with
+every tag and say nothing about which one it is. Every transcript message
+that the TAGS do match is labelled with its highest weighted tag. Each
+example is also copied with random typos, since misspellings are what the
+keyword TAGS miss most. Messages that should get no tag at all (small talk,
+questions for the bot, keyboard noise) are read from a negatives file and
+trained as the NO_TAG class. A multinomial logistic regression over hashed
+features is then fitted with SGD.
+
+The threshold below which the classifier does not guess is tuned on a
+held-out set of `message<TAB>expected tag` lines (an empty tag for messages
+that should get none), none of which are trained on: it is the lowest
+threshold at which the guesses on the tuning set are at least --precision
+right, so the classifier guesses as often as it can while rarely routing a
+message to the wrong tag. A guess on a message that should get no tag counts
+as wrong.
+
+Transcripts are tab-separated files whose last column is the message; lines
+starting with # are ignored in every file. Messages that the TAGS match are
+left out of the negatives and the tuning set, since they never reach the
+classifier.
+
+Usage:
+    python3 train_fallback.py [-o fallback_model.json] [--negatives fallback_negatives.txt]
+        [--tune fallback_tune.tsv] [--precision 0.9] [TRANSCRIPT ...]
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+from collections import Counter
+
+from fallback import NO_TAG, FallbackClassifier, features
+from oxycsbot import OxyCSBot
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+CARRIERS = ['{}', 'i feel {}', 'i feel so {}', "i'm {}", "i'm so {}", 'i think {}', 'just {}', '{} right now']
+
+
+def misspell(text, rng):
+    """Add one random typo to a message."""
+    if len(text) < 3:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    if kind == 2:
+        return text[:i] + text[i] + text[i:]
+    return text[:i] + rng.choice(LETTERS) + text[i + 1:]
+
+
+def load_examples(bot, transcripts):
+    """Collect labelled messages from the lexicon and transcripts.
+
+    Arguments:
+        bot (ChatBot): The chatbot whose TAGS label the messages.
+        transcripts (List[str]): Transcript files.
+
+    Returns:
+        List[Tuple[str, str]]: Each message and its tag.
+    """
+    routed = {rule[0] for rules in bot.ROUTES.values() for rule in rules}
+    examples = [
+        (carrier.format(phrase), tag)
+        for phrase, tags in bot.TAGS.items()
+        for tag in ([tags] if isinstance(tags, str) else tags) if tag in routed
+        for carrier in CARRIERS
+    ]
+    for filename in transcripts:
+        with open(filename) as transcript:
+            for line in transcript:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                message = line.rstrip('\n').split('\t')[-1]
+                tags = Counter({
+                    tag: count for tag, count in bot._get_tags(message).items()
+                    if tag in routed
+                })
+                if tags:
+                    examples.append((message, tags.most_common(1)[0][0]))
+    return examples
+
+
+def read_lines(filename):
+    """Read the lines of a data file, without blank lines and # comments."""
+    with open(filename) as data_file:
+        return [
+            line.rstrip('\n') for line in data_file
+            if line.strip() and not line.startswith('#')
+        ]
+
+
+def load_negatives(bot, filename):
+    """Collect messages that should get no tag.
+
+    Arguments:
+        bot (ChatBot): The chatbot whose TAGS would match the messages.
+        filename (str): A file of messages, one per line.
+
+    Returns:
+        List[Tuple[str, str]]: Each message that the TAGS do not match, and
+            NO_TAG.
+    """
+    return [(message, NO_TAG) for message in read_lines(filename) if not bot._get_tags(message)]
+
+
+def load_cases(bot, filename):
+    """Read a tuning or evaluation set.
+
+    Arguments:
+        bot (ChatBot): The chatbot whose TAGS would match the messages.
+        filename (str): A file of `message<TAB>expected tag` lines.
+
+    Returns:
+        List[Tuple[str, str]]: Each message that the TAGS do not match, and
+            its expected tag (NO_TAG for none).
+    """
+    cases = []
+    for line in read_lines(filename):
+        message, expected = line.split('\t')
+        if not bot._get_tags(message):
+            cases.append((message, expected))
+    return cases
+
+
+def guess(classifier, cases):
+    """Find the best class of each case and its probability."""
+    guesses = []
+    for message, _ in cases:
+        probabilities = classifier.probabilities(message)
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        guesses.append((classifier.classes[best], probabilities[best]))
+    return guesses
+
+
+def score(guesses, cases, threshold):
+    """Measure the guesses the classifier would make at a threshold.
+
+    Arguments:
+        guesses (List[Tuple[str, float]]): The best class of each case and
+            its probability.
+        cases (List[Tuple[str, str]]): Each message and its expected tag.
+        threshold (float): The threshold.
+
+    Returns:
+        int: The number of guesses made.
+        int: The number of them that were right.
+        int: The number of cases with a tag.
+    """
+    made = right = 0
+    for (tag, probability), (_, expected) in zip(guesses, cases):
+        if tag != NO_TAG and probability >= threshold:
+            made += 1
+            right += tag == expected
+    return made, right, sum(1 for _, expected in cases if expected != NO_TAG)
+
+
+def tune(classifier, cases, precision):
+    """Find the lowest threshold that guesses precisely enough.
+
+    Arguments:
+        classifier (FallbackClassifier): The trained classifier.
+        cases (List[Tuple[str, str]]): Each message and its expected tag.
+        precision (float): The share of guesses that must be right.
+
+    Returns:
+        float: The threshold, or 1.0 if no threshold is precise enough.
+    """
+    guesses = guess(classifier, cases)
+    for threshold in sorted({round(p, 2) for _, p in guesses}):
+        made, right, _ = score(guesses, cases, threshold)
+        if made and right / made >= precision:
+            return threshold
+    return 1.0
+
+
+def report(classifier, cases, threshold):
+    """Describe how the classifier guesses on some cases at a threshold."""
+    made, right, tagged = score(guess(classifier, cases), cases, threshold)
+    return ' '.join([
+        f'threshold {threshold:.2f}:',
+        f'{right}/{made} guesses right ({right / made if made else 1:.0%} precision),',
+        f'{right}/{tagged} tagged messages found ({right / tagged if tagged else 0:.0%} recall)',
+    ])
+
+
+def train(examples, buckets, epochs, rate, seed):
+    """Fit a multinomial logistic regression with SGD.
+
+    Arguments:
+        examples (List[Tuple[str, str]]): Each message and its tag.
+        buckets (int): The number of hash buckets.
+        epochs (int): Passes over the examples.
+        rate (float): The learning rate.
+        seed (int): The seed for shuffling.
+
+    Returns:
+        List[str]: The classes.
+        List[float]: The bias of each class.
+        Dict[int, List[float]]: The class weights of each used bucket.
+    """
+    classes = sorted({tag for _, tag in examples})
+    index = {tag: i for i, tag in enumerate(classes)}
+    data = [(features(message, buckets), index[tag]) for message, tag in examples]
+    bias = [0.0] * len(classes)
+    weights = {}
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        step = rate / (1 + epoch)
+        for feats, label in data:
+            scores = list(bias)
+            for bucket in feats:
+                for i, weight in enumerate(weights.get(bucket, ())):
+                    scores[i] += weight
+            top = max(scores)
+            exps = [math.exp(score - top) for score in scores]
+            total = sum(exps)
+            gradient = [exp / total for exp in exps]
+            gradient[label] -= 1
+            for i, g in enumerate(gradient):
+                bias[i] -= step * g
+            for bucket in feats:
+                row = weights.setdefault(bucket, [0.0] * len(classes))
+                for i, g in enumerate(gradient):
+                    row[i] -= step * g
+    return classes, bias, weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('transcripts', nargs='*', help='transcript files')
+    parser.add_argument('-o', '--output', default='fallback_model.json')
+    parser.add_argument('--buckets', type=int, default=4096)
+    parser.add_argument('--epochs', type=int, default=40)
+    parser.add_argument('--rate', type=float, default=0.3)
+    parser.add_argument('--typos', type=int, default=8, help='misspelled copies per example')
+    parser.add_argument('--negatives', default='fallback_negatives.txt', help='messages with no tag')
+    parser.add_argument('--tune', default='fallback_tune.tsv', help='held-out set to tune the threshold on')
+    parser.add_argument('--precision', type=float, default=0.9, help='share of guesses that must be right')
+    parser.add_argument('--threshold', type=float, help='use this threshold instead of tuning one')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if not args.tune and args.threshold is None:
+        parser.error('give --threshold when there is no tuning set')
+
+    bot = OxyCSBot()
+    examples = load_examples(bot, args.transcripts)
+    if args.negatives:
+        examples += load_negatives(bot, args.negatives)
+    rng = random.Random(args.seed)
+    examples += [
+        (misspell(message, rng), tag)
+        for message, tag in examples
+        for _ in range(args.typos)
+    ]
+    classes, bias, weights = train(examples, args.buckets, args.epochs, args.rate, args.seed)
+    model = {
+        'buckets': args.buckets,
+        'classes': classes,
+        'threshold': args.threshold,
+        'bias': [round(b, 3) for b in bias],
+        'weights': {
+            str(bucket): [round(w, 3) for w in row]
+            for bucket, row in sorted(weights.items())
+        },
+    }
+    with open(args.output, 'w') as model_file:
+        json.dump(model, model_file, separators=(',', ':'))
+    print(f'trained on {len(examples)} examples, {len(classes)} classes')
+
+    if args.tune:
+        # Tune the rounded weights that were written, not the exact ones
+        classifier = FallbackClassifier(args.output)
+        cases = load_cases(bot, args.tune)
+        if args.threshold is None:
+            model['threshold'] = tune(classifier, cases, args.precision)
+            if model['threshold'] >= 1.0:
+                print(f'warning: no threshold reaches {args.precision:.0%} precision', file=sys.stderr)
+            with open(args.output, 'w') as model_file:
+                json.dump(model, model_file, separators=(',', ':'))
+        print(f'tuning set of {len(cases)} messages, {report(classifier, cases, model["threshold"])}')
+    print(f'-> {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""A compact, append-only log of chatbot state transitions.
+
+Every `go_to_state` and `finish` can be written to a TransitionLog as one
+small binary record. Logs are rotated once they reach a given size, and can be
+read back one record at a time with `read_records`, so they can be analyzed
+without loading them into memory (see `analyze_transitions.py`).
+
+Each file starts with MAGIC and is followed by records of two kinds:
+
+* `N` records name a state, finish target or tag the first time it is used in
+    the file: the kind, a 16-bit id, an 8-bit length and the UTF-8 name.
+* `T` records are transitions: the kind, a 64-bit conversation hash, the
+    time, the seconds spent responding, the 16-bit ids of the from- and to-
+    states, an 8-bit tag count and the 16-bit ids of the matched tags.
+"""
+
+import os
+import struct
+from hashlib import blake2b
+from time import time
+
+MAGIC = b'RUOKTL1\n'
+NAME = struct.Struct('<cHB')
+TRANSITION = struct.Struct('<cQdfHHB')
+TAG = struct.Struct('<H')
+
+
+def conversation_hash(conversation):
+    """Hash a conversation id so that logs do not identify users.
+
+    Arguments:
+        conversation (Hashable): The conversation id, eg. (channel, user).
+
+    Returns:
+        int: A 64-bit hash of the conversation.
+    """
+    digest = blake2b(repr(conversation).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class TransitionLog:
+    """Write transitions to size-rotated log files in a directory."""
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        """Initialize a TransitionLog.
+
+        Arguments:
+            directory (str): The directory to write log files to.
+            max_bytes (int): The size at which a log file is rotated.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.file = None
+        self.sequence = 0
+        self.names = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        """Start a new log file."""
+        self.close()
+        self.sequence += 1
+        filename = f'transitions-{int(time())}-{os.getpid()}-{self.sequence:04d}.bin'
+        self.file = open(os.path.join(self.directory, filename), 'ab')
+        self.file.write(MAGIC)
+        self.size = len(MAGIC)
+        self.names = {}
+
+    def _name_id(self, name, chunks):
+        """Find the id of a name, defining it in this file if needed."""
+        name_id = self.names.get(name)
+        if name_id is None:
+            name_id = self.names[name] = len(self.names)
+            encoded = name.encode('utf-8')[:255]
+            chunks.append(NAME.pack(b'N', name_id, len(encoded)))
+            chunks.append(encoded)
+        return name_id
+
+    def write(self, conversation, from_state, to_state, tags=(), latency=0.0):
+        """Append a transition to the log.
+
+        Arguments:
+            conversation (Hashable): The conversation id; only its hash is
+                stored.
+            from_state (str): The state before the transition.
+            to_state (str): The state entered, or `finish_<manner>`.
+            tags (Iterable[str]): The tags matched in the message.
+            latency (float): Seconds spent responding to the message.
+        """
+        if self.file is None or self.size >= self.max_bytes:
+            self._open()
+        chunks = []
+        from_id = self._name_id(from_state, chunks)
+        to_id = self._name_id(to_state, chunks)
+        tag_ids = [self._name_id(tag, chunks) for tag in tags][:255]
+        chunks.append(TRANSITION.pack(
+            b'T', conversation_hash(conversation), time(), latency,
+            from_id, to_id, len(tag_ids),
+        ))
+        chunks.extend(TAG.pack(tag_id) for tag_id in tag_ids)
+        record = b''.join(chunks)
+        self.file.write(record)
+        self.file.flush()
+        self.size += len(record)
+
+    def close(self):
+        """Close the current log file."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def get_transition_log():
+    """Open the transition log named in the environment.
+
+    If TRANSITION_LOG is set to a directory, every state transition is logged
+    there, in files of at most TRANSITION_LOG_MAX_BYTES bytes (64 MiB by
+    default).
+
+    Returns:
+        TransitionLog: The transition log, or None if logging is disabled.
+    """
+    if 'TRANSITION_LOG' not in os.environ:
+        return None
+    max_bytes = int(os.environ.get('TRANSITION_LOG_MAX_BYTES', 64 * 1024 * 1024))
+    return TransitionLog(os.environ['TRANSITION_LOG'], max_bytes)
+
+
+def read_records(filename, chunk_size=1024 * 1024):
+    """Read the transitions of a log file one at a time.
+
+    A record cut short at the end of the file (eg. by a crash while writing)
+    is ignored.
+
+    Arguments:
+        filename (str): The log file.
+        chunk_size (int): How many bytes to read at a time.
+
+    Yields:
+        Tuple[int, float, float, str, str, Tuple[str, ...]]: The conversation
+            hash, time, latency, from-state, to-state and tags of each
+            transition.
+    """
+    names = []
+    with open(filename, 'rb') as log:
+        if log.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{filename} is not a transition log')
+        buffer = b''
+        while True:
+            chunk = log.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            offset = 0
+            end = len(buffer)
+            while offset < end:
+                kind = buffer[offset:offset + 1]
+                if kind == b'N':
+                    if offset + NAME.size > end:
+                        break
+                    _, name_id, length = NAME.unpack_from(buffer, offset)
+                    start = offset + NAME.size
+                    if start + length > end:
+                        break
+                    if name_id == len(names):
+                        names.append(buffer[start:start + length].decode('utf-8'))
+                    offset = start + length
+                elif kind == b'T':
+                    if offset + TRANSITION.size > end:
+                        break
+                    _, conversation, when, latency, from_id, to_id, count = (
+                        TRANSITION.unpack_from(buffer, offset))
+                    start = offset + TRANSITION.size
+                    if start + count * TAG.size > end:
+                        break
+                    tags = tuple(
+                        names[TAG.unpack_from(buffer, start + i * TAG.size)[0]]
+                        for i in range(count)
+                    )
+                    offset = start + count * TAG.size
+                    yield conversation, when, latency, names[from_id], names[to_id], tags
+                else:
+                    raise ValueError(f'{filename} has a corrupt record')
+            buffer = buffer[offset:]
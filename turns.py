@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Aggregation of quick successive messages into single conversation turns."""
+
+
+class Turn:
+    """The fragments of a turn that has not been answered yet."""
+
+    __slots__ = ('fragments', 'first', 'last')
+
+    def __init__(self, now):
+        self.fragments = []
+        self.first = now
+        self.last = now
+
+
+class TurnAggregator:
+    """Merge messages that arrive within a short window into one turn.
+
+    People often split one thought across several quick messages ("i'm so",
+    "overwhelmed", "with midterms"). Instead of answering every fragment, the
+    aggregator keeps a pending turn per conversation and releases it once no
+    new fragment has arrived for `window` seconds. So that someone who keeps
+    typing still gets an answer, a turn is also released once it is
+    `max_age` seconds old or has `max_fragments` fragments.
+
+    Tags are counted once per turn, on the merged text, when the turn is
+    released, so fragments cost nothing to tag while they wait and phrases
+    that are split across two fragments are still matched.
+    """
+
+    def __init__(self, tagger, window=2.0, max_age=10.0, max_fragments=20):
+        """Initialize a TurnAggregator.
+
+        Arguments:
+            tagger (Callable[[str], Dict[str, int]]): Counts the tags of a
+                message, usually a chatbot's `_get_tags`.
+            window (float): Seconds of quiet before a turn is released.
+            max_age (float): Seconds after its first fragment that a turn is
+                released, even if fragments are still arriving.
+            max_fragments (int): The most fragments in one turn.
+        """
+        self.tagger = tagger
+        self.window = window
+        self.max_age = max_age
+        self.max_fragments = max_fragments
+        self.pending = {}
+        self.full = []
+        # No turn is ready before this time, so polling can skip the scan
+        self.next_ready = float('inf')
+
+    def __len__(self):
+        return len(self.pending) + len(self.full)
+
+    def add(self, key, message, now):
+        """Add a message fragment to the pending turn of a conversation.
+
+        Arguments:
+            key (Hashable): The conversation the message belongs to.
+            message (str): The message fragment.
+            now (float): The time the fragment arrived, in seconds.
+        """
+        turn = self.pending.get(key)
+        if turn is not None and len(turn.fragments) >= self.max_fragments:
+            # Set the full turn aside, so it is answered before this one
+            self.full.append((key, self.pending.pop(key)))
+            turn = None
+        if turn is None:
+            turn = self.pending[key] = Turn(now)
+        turn.fragments.append(message)
+        turn.last = now
+        if len(turn.fragments) >= self.max_fragments:
+            self.next_ready = now
+        else:
+            self.next_ready = min(self.next_ready, now + self.window, turn.first + self.max_age)
+
+    def pop_ready(self, now):
+        """Release every turn whose window has elapsed, or that is too big.
+
+        Arguments:
+            now (float): The current time, in seconds.
+
+        Returns:
+            List[Tuple[Hashable, str, Dict[str, float]]]: The conversation,
+                the merged message and its tags for each released turn.
+        """
+        if now < self.next_ready:
+            return []
+        ready = self.full
+        self.full = []
+        next_ready = float('inf')
+        for key, turn in list(self.pending.items()):
+            ready_at = min(turn.last + self.window, turn.first + self.max_age)
+            if now >= ready_at or len(turn.fragments) >= self.max_fragments:
+                del self.pending[key]
+                ready.append((key, turn))
+            else:
+                next_ready = min(next_ready, ready_at)
+        self.next_ready = next_ready
+        released = []
+        for key, turn in ready:
+            message = ' '.join(turn.fragments)
+            released.append((key, message, self.tagger(message)))
+        return released